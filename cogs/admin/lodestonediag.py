@@ -0,0 +1,209 @@
+import discord
+import settings
+import time
+
+from discord.ext import commands
+from utils.app.security import is_user_allowed
+from utils.database import postgres
+from utils.ffxiv import crest
+from utils.ffxiv import refresh as charrefresh
+from utils.ffxiv import roster
+from utils.lodestone_scraper import breaker, metrics, ratelimit
+from utils.lodestone_scraper.scraper import LodestoneScraper
+
+
+logger = settings.logging.getLogger("bot")
+
+class LodestoneDiag(commands.Cog):
+    """Lodestone scraper health commands."""
+
+    # Show how much headroom each region host's rate limiter has
+    @commands.command(name="lodestonelimits", help="Shows the Lodestone rate limiter bucket for each region host")
+    @is_user_allowed("USER_ORACLE", "ROLE_GUILDMASTER", "USER_BOT_OWNER")
+    async def lodestone_limits(self, ctx: commands.Context):
+        try:
+            buckets = ratelimit.snapshot()
+            circuits = breaker.snapshot()
+            if not buckets:
+                await ctx.send("No Lodestone requests made since startup, all buckets are full.")
+                return
+
+            lines = ["**Lodestone Rate Limiter:**"]
+            for host, bucket in buckets.items():
+                line = (
+                    f"• `{host}` — {bucket['tokens']}/{bucket['burst']} tokens, "
+                    f"{bucket['rate']} req/s, queue wait {bucket['queue_wait']}s"
+                )
+                if bucket["blocked_for"]:
+                    line += f", blocked by Retry-After for {bucket['blocked_for']}s"
+                circuit = circuits.get(host)
+                if circuit and circuit["state"] != breaker.CLOSED:
+                    line += f"\n  ⚠ circuit {circuit['state']} ({circuit['reason']}), next probe in {circuit['retry_in']}s"
+                elif circuit and circuit["trips"]:
+                    line += f", circuit closed (tripped {circuit['trips']}x since startup)"
+                lines.append(line)
+
+            await ctx.send("\n".join(lines))
+        except Exception as e:
+            logger.exception("Failed to read Lodestone rate limiter state")
+            await ctx.send(f"Error reading rate limiter: `{type(e).__name__}: {e}`")
+
+    # Show where scrape time goes, stage by stage, optionally narrowed to one region or selector file
+    @commands.command(name="scrapemetrics", help="Shows Lodestone scraper timings and counters, filter by region/file or 'reset'")
+    @is_user_allowed("USER_ORACLE", "ROLE_GUILDMASTER", "USER_BOT_OWNER")
+    async def scrape_metrics(self, ctx: commands.Context, match: str | None = None):
+        try:
+            if match == "reset":
+                metrics.reset()
+                await ctx.send("Scraper metrics reset.")
+                return
+
+            totals = metrics.totals(match)
+            if not totals["stages"] and not totals["counters"]:
+                await ctx.send("No scraper metrics recorded" + (f" matching `{match}`." if match else " yet."))
+                return
+
+            minutes = (time.time() - metrics.since()) / 60
+            lines = [f"**Lodestone Scraper Metrics** ({match or 'everything'}, last {minutes:.0f} min):", "```"]
+            lines.append(f"{'stage':<10}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+            for stage in metrics.STAGES:
+                histogram = totals["stages"].get(stage)
+                if histogram is None or not histogram.count:
+                    continue
+                lines.append(
+                    f"{stage:<10}{histogram.count:>7}{_ms(histogram.quantile(0.5)):>9}{_ms(histogram.quantile(0.95)):>9}"
+                    f"{_ms(histogram.quantile(0.99)):>9}{_ms(histogram.max):>9}"
+                )
+            lines.append("```")
+
+            counters = totals["counters"]
+            lookups = sum(counters.get(name, 0) for name in ("cache_hit", "cache_stale", "cache_miss"))
+            hit_rate = f"{counters.get('cache_hit', 0) / lookups:.0%}" if lookups else "n/a"
+            statuses = ", ".join(
+                f"{name.removeprefix('status_')}: {value}" for name, value in sorted(counters.items()) if name.startswith("status_")
+            )
+            errors = ", ".join(
+                f"{name.removeprefix('error_')}: {value}" for name, value in sorted(counters.items()) if name.startswith("error_")
+            )
+            lines.append(
+                f"• Cache: {hit_rate} hit rate ({counters.get('cache_hit', 0)} hits, {counters.get('cache_stale', 0)} stale, "
+                f"{counters.get('cache_miss', 0)} misses, {counters.get('cache_bypass', 0)} bypassed)"
+            )
+            lines.append(
+                f"• Downloaded: {counters.get('bytes', 0) / 1024 / 1024:.1f} MiB, {counters.get('retries', 0)} retries, "
+                f"{counters.get('stopped_early', 0)} stopped early"
+            )
+            lines.append(f"• Status codes: {statuses or 'none'}" + (f", errors: {errors}" if errors else ""))
+
+            # Slowest selector files first, that's where to look
+            per_label = sorted(
+                metrics.snapshot(match).items(),
+                key=lambda item: item[1]["stages"]["total"].quantile(0.95) if "total" in item[1]["stages"] else 0,
+                reverse=True,
+            )
+            for (region, filename), entry in per_label:
+                total = entry["stages"].get("total")
+                if total is None:
+                    continue
+                line = (
+                    f"• `{region}` `{filename}`: {total.count} loads, p50 {_ms(total.quantile(0.5))}, "
+                    f"p95 {_ms(total.quantile(0.95))}"
+                )
+                if len("\n".join(lines)) + len(line) > 1950:
+                    lines.append("• ...narrow it down with `~scrapemetrics <region or file>` for the rest")
+                    break
+                lines.append(line)
+            await ctx.send("\n".join(lines))
+        except Exception as e:
+            logger.exception("Failed to read scraper metrics")
+            await ctx.send(f"Error reading scraper metrics: `{type(e).__name__}: {e}`")
+
+    # Show how the background character refresh is getting on, or push one character to the front
+    @commands.command(name="charrefresh", help="Shows the character refresh scheduler, or queues a Lodestone ID to refresh next")
+    @is_user_allowed("USER_ORACLE", "ROLE_GUILDMASTER", "USER_BOT_OWNER")
+    async def char_refresh(self, ctx: commands.Context, lodestone_id: int | None = None):
+        try:
+            state = charrefresh.status()
+            if state is None:
+                await ctx.send("The character refresh scheduler isn't running.")
+                return
+
+            if lodestone_id is not None:
+                if charrefresh.request_refresh(lodestone_id):
+                    await ctx.send(f"Character `{lodestone_id}` is next in line for a refresh.")
+                else:
+                    await ctx.send(f"Character `{lodestone_id}` is being refreshed right now.")
+                return
+
+            summary = await postgres.fetch_refresh_summary(charrefresh.cadence())
+            oldest = summary["oldest"].strftime("%Y-%m-%d %H:%M UTC") if summary["oldest"] else "never"
+            last_flush = f"{state['last_flush_ago']}s ago" if state["last_flush_ago"] is not None else "not yet"
+            lines = [
+                "**Character Refresh:**",
+                f"• Linked characters: {summary['linked']}, {summary['refreshed']} refreshed at least once, oldest refresh {oldest}",
+                f"• Due or overdue: {summary['stale']}, failing: {summary['failing']}",
+                f"• Queue: {state['queued']} waiting, {state['in_flight']} in flight, {state['unsaved']} waiting to be saved",
+                f"• Since startup: {state['refreshed']} refreshed, {state['failed']} failed, {state['deferred']} put off for interactive scrapes",
+                f"• Active users being refreshed more often: {state['active_users']}, last save {last_flush}",
+            ]
+            if state["lodestone_down_for"]:
+                lines.append(f"• Paused, Lodestone is unavailable, trying again in {state['lodestone_down_for']}s")
+            if state["paused"]:
+                lines.append(f"• Refreshes put off for Lodestone outages since startup: {state['paused']}")
+            await ctx.send("\n".join(lines))
+        except Exception as e:
+            logger.exception("Failed to read character refresh state")
+            await ctx.send(f"Error reading character refresh state: `{type(e).__name__}: {e}`")
+
+    # Sync the FC roster right now instead of waiting for the hourly run
+    @commands.command(name="fcsync", help="Syncs the Free Company roster (and rank roles) with the Lodestone now")
+    @is_user_allowed("USER_ORACLE", "ROLE_GUILDMASTER", "USER_BOT_OWNER")
+    async def fc_sync(self, ctx: commands.Context):
+        try:
+            await ctx.send("Syncing the FC roster with the Lodestone...")
+            diff = await roster.sync(guild=ctx.guild)
+            if not diff:
+                await ctx.send(f"Roster is up to date, {len(diff.current)} members and nothing changed.")
+                return
+
+            lines = [f"**FC Roster Synced:** {diff.summary()}"]
+            if diff.joined:
+                lines.append("• Joined: " + ", ".join(name for name, _, _ in diff.joined.values()))
+            if diff.left:
+                lines.append("• Left: " + ", ".join(name for name, _, _ in diff.left.values()))
+            for lodestone_id, (old_rank, new_rank) in diff.rank_changed.items():
+                lines.append(f"• {diff.current[lodestone_id][0]}: {old_rank} → {new_rank}")
+            await ctx.send("\n".join(lines)[:2000])
+        except Exception as e:
+            logger.exception("FC roster sync failed")
+            await ctx.send(f"Error syncing the FC roster: `{type(e).__name__}: {e}`")
+
+    # Post an FC's name and composited crest, mostly to check the crest cache works
+    @commands.command(name="fccrest", help="Shows a Free Company's crest, ours if no ID is given")
+    @is_user_allowed("USER_ORACLE", "ROLE_GUILDMASTER", "USER_BOT_OWNER")
+    async def fc_crest(self, ctx: commands.Context, fc_id: int = None):
+        try:
+            fc_id = fc_id or settings.FC_ID
+            if not fc_id:
+                await ctx.send("No FC ID given and `FC_ID` isn't set.")
+                return
+
+            fc = await LodestoneScraper().scrape_record("freecompany.freecompany", fc_id, fields=["NAME", "CREST_LAYERS"])
+            path = await crest.get_crest(fc.CREST_LAYERS)
+            if path is None:
+                await ctx.send(f"No crest found on the Lodestone page for FC `{fc_id}`.")
+                return
+
+            embed = discord.Embed(title=fc.NAME or f"FC {fc_id}", colour=discord.Colour.blurple())
+            embed.set_thumbnail(url=f"attachment://{path.name}")
+            embed.set_footer(text=f"Crest cache: {crest.stats['hits']} hits, {crest.stats['composited']} composited")
+            await ctx.send(embed=embed, file=discord.File(path, filename=path.name))
+        except Exception as e:
+            logger.exception("Failed to show FC crest")
+            await ctx.send(f"Error showing FC crest: `{type(e).__name__}: {e}`")
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(LodestoneDiag(bot))
@@ -0,0 +1,55 @@
+import settings
+
+from discord.ext import commands, tasks
+from utils.database import postgres
+from utils.ffxiv import achievements, roster
+
+
+logger = settings.logging.getLogger("bot")
+
+class FCRoster(commands.Cog):
+    """Keeps the stored Free Company roster (and rank roles) and members' achievements in step with the Lodestone."""
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+    async def cog_load(self):
+        if settings.FC_ID:
+            self.hourly_sync.start()
+            self.achievement_sync.start()
+        else:
+            logger.info("FC_ID not set, FC roster sync is off")
+
+    async def cog_unload(self):
+        self.hourly_sync.cancel()
+        self.achievement_sync.cancel()
+
+    @tasks.loop(hours=1)
+    async def hourly_sync(self):
+        try:
+            await roster.sync(guild=self.bot.get_guild(settings.GUILD_ID)) # type: ignore
+        except Exception:
+            logger.exception("Hourly FC roster sync failed")
+
+    @hourly_sync.before_loop
+    async def before_hourly_sync(self):
+        await self.bot.wait_until_ready()  # the guild (and its roles) need to be in the cache
+
+    # Incremental, so most members cost one page
+    @tasks.loop(hours=6)
+    async def achievement_sync(self):
+        try:
+            members = await postgres.fetch_fc_roster(settings.FC_ID)
+            results = await achievements.sync_many(row["lodestone_id"] for row in members)
+            new = sum(result for result in results.values() if isinstance(result, int))
+            failed = sum(1 for result in results.values() if isinstance(result, Exception))
+            logger.info("FC achievement sync: %s new achievements across %s members, %s failed", new, len(results), failed)
+        except Exception:
+            logger.exception("FC achievement sync failed")
+
+    @achievement_sync.before_loop
+    async def before_achievement_sync(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(FCRoster(bot))
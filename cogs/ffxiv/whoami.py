@@ -7,32 +7,53 @@ import secrets
 import settings
 
 from utils.database import postgres, redis
-from utils.lodestone_scraper.scraper import LodestoneScraper
+from utils.lodestone_scraper.errors import LodestoneUnavailable
+from utils.ffxiv import refresh as charrefresh
+from utils.ffxiv import verification
 
 logger = settings.logging.getLogger("bot")
 
 
-async def fetch_bio(lodestone_id, region="na"):
-    scraper = LodestoneScraper(region=region)
-    # The selector string is for the About Me field, adjust as needed:
-    data = await scraper.scrape("profile.character.BIO", lodestone_id)
-    return data or ""
-
-async def fetch_basic_profile(lodestone_id, region="na"):
-    scraper = LodestoneScraper(region=region)
-    # You can fetch all these at once if your selectors.json supports it:
-    data = await scraper.scrape("profile.character", lodestone_id)
-    return {
-        "forename": data.get("NAME", "").split(" ")[0] if data.get("NAME") else "",
-        "surname": data.get("NAME", "").split(" ")[1] if data.get("NAME") and len(data.get("NAME").split(" ")) > 1 else "",
-        "server_name": data.get("SERVER", {}).get("World") if isinstance(data.get("SERVER"), dict) else "",
-        "data_center_name": data.get("SERVER", {}).get("DC") if isinstance(data.get("SERVER"), dict) else "",
-    }
+def lodestone_unavailable_message(exc: LodestoneUnavailable) -> str:
+    minutes = max(round(exc.retry_in / 60), 1)
+    if exc.maintenance:
+        return f"The Lodestone is down for maintenance right now, so I can't check your profile. Give it another go in {minutes} min or so."
+    return f"The Lodestone isn't responding right now, so I can't check your profile. Give it another go in {minutes} min or so."
+
+def verification_message(result: verification.VerifyResult) -> str:
+    if result.status == verification.LINKED:
+        name = f" as **{result.character.NAME}**" if result.character is not None and result.character.NAME else ""
+        return f"Character verified and linked{name}!"
+    if result.status == verification.NOT_FOUND:
+        return f"There's no character with the Lodestone ID `{result.lodestone_id}`, double check the number in your profile's URL."
+    if result.status == verification.NOT_YET:
+        return (
+            "Token not found in the profile yet. Make sure you pasted it in **Character Profile** and saved it, "
+            "the Lodestone can take a few minutes to catch up."
+        )
+    return "Verification token expired or invalid, run `/whoami create` to get a new one."
+
+def notifier(interaction: discord.Interaction):
+    """
+    How the background poller reports back: a followup on the original interaction, or a DM if that's gone stale.
+    """
+    async def notify(result: verification.VerifyResult):
+        message = verification_message(result)
+        if result.status == verification.EXPIRED:
+            message = (
+                "I kept checking your Lodestone profile but never found the token before it expired. "
+                "Run `/whoami create` to try again."
+            )
+        try:
+            await interaction.followup.send(message, ephemeral=True)
+        except discord.HTTPException:
+            await interaction.user.send(message)
+    return notify
 
 
 # ───────────────────────────────────────────────────────────────
 #   App Command Group: /whoami
-#   Subcommands: /whoami create, /whoami view
+#   Subcommands: /whoami create, /whoami view, /whoami refresh
 # ───────────────────────────────────────────────────────────────
 
 class WhoAmIGroup(app_commands.Group):
@@ -41,8 +62,10 @@ class WhoAmIGroup(app_commands.Group):
 
     # Gets the command working on linking your lodestone profile
     @app_commands.command(name="create", description="Link your FFXIV character")
-    async def create(self, interaction: discord.Interaction):
+    @app_commands.describe(lodestone_id="Your Lodestone ID, if you give it now I'll check for the code by myself")
+    async def create(self, interaction: discord.Interaction, lodestone_id: int | None = None):
         token_b64 = base64.b64encode(secrets.token_bytes(16)).decode("utf-8")
+        verification.stop_polling(interaction.user.id)  # any old token is about to be replaced
         await redis.set_verification(interaction.user.id, token_b64, ttl=600)
         file = discord.File("static/img/lodestonecharprofguide.png", filename="lodestonecharprofguide.png")
         embed = discord.Embed(
@@ -52,6 +75,9 @@ class WhoAmIGroup(app_commands.Group):
                 "Add the following code to your Lodestone profile's **Character profile** field:\n\n"
                 f"```\n\n{token_b64}\n\n```\n"
                 "After saving it on the Lodestone site, press **Verify** and give me your Lodestone ID."
+                if lodestone_id is None else
+                "Once it's saved on the Lodestone site I'll spot it by myself and let you know, no need to press anything. "
+                "**Verify** is there if you'd rather not wait."
             ),
         )
 
@@ -62,6 +88,8 @@ class WhoAmIGroup(app_commands.Group):
             view=VerifyButtonView(token_b64),
             ephemeral=True,
         )
+        if lodestone_id is not None:
+            verification.start_polling(interaction.user.id, lodestone_id, token_b64, notifier(interaction))
 
     # And this displays it (very limited right now)
     @app_commands.command(name="view", description="Show your linked FFXIV character")
@@ -90,6 +118,29 @@ class WhoAmIGroup(app_commands.Group):
                 ephemeral=True,
             )
 
+    # Bumps your character to the front of the background refresh queue
+    @app_commands.command(name="refresh", description="Update your linked character from the Lodestone")
+    async def refresh(self, interaction: discord.Interaction):
+        lodestone_id = await postgres.fetchval(
+            "SELECT lodestone_id FROM xiv_char WHERE discord_id = $1",
+            interaction.user.id,
+        )
+        if lodestone_id is None:
+            await interaction.response.send_message(
+                "You haven't linked a character yet. Use `/whoami create` to get started.",
+                ephemeral=True,
+            )
+            return
+        if not charrefresh.running():
+            await interaction.response.send_message("Character refreshes are switched off right now, try again later.", ephemeral=True)
+            return
+
+        if charrefresh.request_refresh(lodestone_id):
+            message = "Your character is next in line for a refresh, give it a minute."
+        else:
+            message = "Your character is being refreshed right now, check back in a minute."
+        await interaction.response.send_message(message, ephemeral=True)
+
 
 class WhoAmI(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -97,6 +148,12 @@ class WhoAmI(commands.Cog):
         self.bot.tree.add_command(WhoAmIGroup())
         print("App commands now:", list(self.bot.tree.get_commands()))
 
+    # Anyone chatting gets their character refreshed more often while they're around
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if not message.author.bot:
+            charrefresh.mark_active(message.author.id)
+
 
 
 # pls don't touch this I'm pretty sure there's a load-bearing coconut.jpg in here
@@ -123,52 +180,30 @@ class VerifyModal(discord.ui.Modal, title="Lodestone Verification"):
 
         user_id = interaction.user.id
         lodestone_id_raw = self.lodestone_id.value.strip()
-        pending_token = await redis.get_verification(user_id)
-        if pending_token is None or pending_token != self.token:
+        if not lodestone_id_raw.isdigit():
             await interaction.followup.send(
-                "Verification token expired or invalid.", ephemeral=True
+                "That doesn't look like a Lodestone ID, it's the number in your character's Lodestone URL.", ephemeral=True
             )
             return
+        lodestone_id = int(lodestone_id_raw)
         try:
-            bio_text = await fetch_bio(lodestone_id_raw)
-            if self.token not in bio_text:
+            result = await verification.verify(user_id, lodestone_id, self.token)
+            if result.status == verification.NOT_YET:
+                # Probably just the Lodestone being slow to save, keep an eye on it rather than make them retry
+                verification.start_polling(user_id, lodestone_id, self.token, notifier(interaction))
+                minutes = max(round(await redis.get_verification_ttl(user_id) / 60), 1)
                 await interaction.followup.send(
-                    "Token not found in the profile. Make sure you pasted it in **Character Profile** "
-                    "and that the Lodestone page has finished saving.",
+                    verification_message(result) + f" I'll keep checking for the next {minutes} min and let you know.",
                     ephemeral=True,
                 )
                 return
-            parsed = await fetch_basic_profile(lodestone_id_raw)
-            logger = settings.logging.getLogger("whoami_debug")
-            logger.info("DEBUG parsed: %r", parsed)
-            logger.info("DEBUG insert args: %r", [
-                int(lodestone_id_raw),
-                user_id,
-                parsed.get("forename", ""),
-                parsed.get("surname", ""),
-                parsed.get("server_name", ""),
-                parsed.get("data_center_name", ""),
-            ])
-            await postgres.execute(
-                """
-                INSERT INTO xiv_char
-                    (lodestone_id, discord_id, forename, surname, server_name, data_center_name)
-                VALUES
-                    ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (lodestone_id) DO UPDATE
-                    SET discord_id = EXCLUDED.discord_id
-                """,
-                int(lodestone_id_raw),
-                user_id,
-                parsed.get("forename", ""),
-                parsed.get("surname", ""),
-                parsed.get("server_name", ""),
-                parsed.get("data_center_name", ""),
-            )
-            await redis.delete_verification(user_id)
-            await interaction.followup.send(
-                "Character verified and linked!", ephemeral=True
-            )
+            if result.status in (verification.LINKED, verification.NOT_FOUND):
+                verification.stop_polling(user_id)
+            await interaction.followup.send(verification_message(result), ephemeral=True)
+        except LodestoneUnavailable as exc:
+            # Nothing wrong with what they did, the Lodestone's just down, so no stack trace and no scary error
+            logger.info("Verification for %s hit an unavailable Lodestone: %s", user_id, exc)
+            await interaction.followup.send(lodestone_unavailable_message(exc), ephemeral=True)
         except Exception as exc:
             logger.error("Exception during verification", exc_info=True)
             await interaction.followup.send(
@@ -3,22 +3,30 @@ This is the main file of the bot and should be the one we're running to start it
 """
 
 import asyncio
-import discord
-import settings
-import utils.database.postgres as postgres
-import utils.community.roleselection as roleselection
 import os
 import pathlib
-from discord.ext import commands
-from utils.app.status import write_status
+from datetime import timedelta
 
-logger = settings.logging.getLogger("bot")
+# The Lodestone parse pool spawns its workers, and a spawned worker imports this file again
+# (as __mp_main__), so only the real start-up gets discord, settings and its logging setup
+if __name__ == "__main__":
+    import discord
+    import settings
+    import utils.database.postgres as postgres
+    import utils.lodestone_scraper.httpclient as httpclient
+    import utils.lodestone_scraper.parsepool as parsepool
+    import utils.lodestone_scraper.archive as archive
+    import utils.lodestone_scraper.scraper as scraper
+    import utils.ffxiv.refresh as charrefresh
+    import utils.community.roleselection as roleselection
+    from discord.ext import commands
+    from utils.app.status import write_status
+
+    logger = settings.logging.getLogger("bot")
 
 # List of cogs that should always be loaded and protected from unload/reload
 ESSENTIAL_COGS = ["cogs.admin"]
 
-import pathlib
-
 async def bootstrap_schema(conn, sql_path="utils/database/buildAll.sql"):
     sql_file = pathlib.Path(sql_path)
     if not sql_file.exists():
@@ -227,6 +235,32 @@ async def run():
         logger.exception("Failed to connect to the database")
         return
 
+    # One region for every scrape, so verification and the background syncs share a rate limiter and breaker
+    scraper.set_default_region(settings.LODESTONE_REGION)
+
+    # Lodestone HTTP pool
+    await httpclient.connect()
+    logger.info("Lodestone HTTP session pool created")
+
+    # Lodestone parse workers, so big pages don't block the gateway
+    try:
+        await parsepool.start()
+        logger.info("Lodestone parse pool started")
+    except Exception:
+        logger.exception("Failed to start the Lodestone parse pool, parsing on the event loop instead")
+
+    # Raw page archive, so new selector fields can be backfilled without scraping everyone again
+    if settings.LODESTONE_ARCHIVE_DIR:
+        await archive.start(settings.LODESTONE_ARCHIVE_DIR, retention_days=settings.LODESTONE_ARCHIVE_DAYS)
+        logger.info("Lodestone page archive on, writing to %s", settings.LODESTONE_ARCHIVE_DIR)
+
+    # Keep linked characters fresh in the background
+    await charrefresh.start(
+        cadence=timedelta(hours=settings.LODESTONE_REFRESH_HOURS),
+        concurrency=settings.LODESTONE_REFRESH_CONCURRENCY,
+    )
+    logger.info("Character refresh scheduler started")
+
     # Load cogs recursively
     loaded_cogs = set()
     for cog_module in walk_cogs(settings.COGS_DIR):
@@ -258,8 +292,15 @@ async def run():
         # Write offline status on shutdown
         await write_status("offline", reason="Bot shutdown")
         await bot.close()
+        await charrefresh.close()  # writes its last batch, so before the database goes
+        logger.info("Character refresh scheduler stopped")
         await postgres.close()
         logger.info("Database connection pool closed")
+        await httpclient.close()
+        logger.info("Lodestone HTTP session pool closed")
+        await parsepool.close()
+        logger.info("Lodestone parse pool closed")
+        await archive.close()
         logger.info("Bot has been shut down safely")
 
 
@@ -65,6 +65,16 @@ FERNET_SECRET_KEY = os.getenv("FERNET_SECRET_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
 REDIS_URL = os.getenv("REDIS_URL")
 
+# LODESTONE
+LODESTONE_REGION = os.getenv("LODESTONE_REGION") or "na" # Lodestone region host everything is scraped from (na, eu, jp, fr, de)
+LODESTONE_REFRESH_HOURS = env_int("LODESTONE_REFRESH_HOURS") or 12 # How often every linked character gets re-scraped
+LODESTONE_REFRESH_CONCURRENCY = env_int("LODESTONE_REFRESH_CONCURRENCY") or 3 # Characters refreshed at once
+LODESTONE_ARCHIVE_DIR = os.getenv("LODESTONE_ARCHIVE_DIR") # Keep every downloaded Lodestone page here for re-extraction, unset = off
+LODESTONE_ARCHIVE_DAYS = env_int("LODESTONE_ARCHIVE_DAYS") or 30 # How long archived pages are kept (each URL keeps its newest)
+LODESTONE_CREST_DIR = os.getenv("LODESTONE_CREST_DIR") or "cache/crests" # Where composited FC crest PNGs are cached
+FC_ID = env_int("FC_ID") # Our Free Company's Lodestone ID, for the roster sync
+FC_ROSTER_ROLES = bool(env_int("FC_ROSTER_ROLES")) # 1 to keep linked members on the fc_ranks role matching their FC rank
+
 
 # The role categoriser and emojifier need this dictionary to function, update as needed.
 # expects application emojis to use a category_emoji naming convention
@@ -81,6 +81,44 @@ CREATE TABLE IF NOT EXISTS xiv_jobs (
     edited_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Every job on the Lodestone class/job page, full_name squashed to capitals is how classjob.json names it
+-- Rows already there are left alone, so edits stick
+INSERT INTO xiv_jobs (job_name, full_name, job_role, category, version_added, sort_order) VALUES
+    ('PLD', 'Paladin', 'Tank', 'DoW', '2.0', 1),
+    ('WAR', 'Warrior', 'Tank', 'DoW', '2.0', 2),
+    ('DRK', 'Dark Knight', 'Tank', 'DoW', '3.0', 3),
+    ('GNB', 'Gunbreaker', 'Tank', 'DoW', '5.0', 4),
+    ('WHM', 'White Mage', 'Healer', 'DoM', '2.0', 5),
+    ('SCH', 'Scholar', 'Healer', 'DoM', '2.0', 6),
+    ('AST', 'Astrologian', 'Healer', 'DoM', '3.0', 7),
+    ('SGE', 'Sage', 'Healer', 'DoM', '6.0', 8),
+    ('MNK', 'Monk', 'Melee', 'DoW', '2.0', 9),
+    ('DRG', 'Dragoon', 'Melee', 'DoW', '2.0', 10),
+    ('NIN', 'Ninja', 'Melee', 'DoW', '2.4', 11),
+    ('SAM', 'Samurai', 'Melee', 'DoW', '4.0', 12),
+    ('RPR', 'Reaper', 'Melee', 'DoW', '6.0', 13),
+    ('VPR', 'Viper', 'Melee', 'DoW', '7.0', 14),
+    ('BRD', 'Bard', 'Ranged', 'DoW', '2.0', 15),
+    ('MCH', 'Machinist', 'Ranged', 'DoW', '3.0', 16),
+    ('DNC', 'Dancer', 'Ranged', 'DoW', '5.0', 17),
+    ('BLM', 'Black Mage', 'Magic', 'DoM', '2.0', 18),
+    ('SMN', 'Summoner', 'Magic', 'DoM', '2.0', 19),
+    ('RDM', 'Red Mage', 'Magic', 'DoM', '4.0', 20),
+    ('PCT', 'Pictomancer', 'Magic', 'DoM', '7.0', 21),
+    ('BLU', 'Blue Mage', 'Limited', 'DoM', '4.5', 22),
+    ('CRP', 'Carpenter', 'Crafter', 'DoH', '2.0', 23),
+    ('BSM', 'Blacksmith', 'Crafter', 'DoH', '2.0', 24),
+    ('ARM', 'Armorer', 'Crafter', 'DoH', '2.0', 25),
+    ('GSM', 'Goldsmith', 'Crafter', 'DoH', '2.0', 26),
+    ('LTW', 'Leatherworker', 'Crafter', 'DoH', '2.0', 27),
+    ('WVR', 'Weaver', 'Crafter', 'DoH', '2.0', 28),
+    ('ALC', 'Alchemist', 'Crafter', 'DoH', '2.0', 29),
+    ('CUL', 'Culinarian', 'Crafter', 'DoH', '2.0', 30),
+    ('MIN', 'Miner', 'Gatherer', 'DoL', '2.0', 31),
+    ('BTN', 'Botanist', 'Gatherer', 'DoL', '2.0', 32),
+    ('FSH', 'Fisher', 'Gatherer', 'DoL', '2.0', 33)
+ON CONFLICT (job_name) DO NOTHING;
+
 -- Dynamic character ranks
 CREATE TABLE IF NOT EXISTS xiv_char_field_ops (
     id SERIAL, -- UID
@@ -99,11 +137,16 @@ CREATE TABLE IF NOT EXISTS xiv_char_jobs (
     lodestone_id BIGINT, -- Lodestone character number
     job_name TEXT,  -- 'GLD', 'PLD', etc.
     job_level INTEGER, -- Level
+    job_exp BIGINT, -- EXP into the current level, NULL at the cap
+    job_exp_max BIGINT, -- EXP needed for the next level, NULL at the cap
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     edited_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (lodestone_id, job_name),
     FOREIGN KEY (lodestone_id) REFERENCES xiv_char (lodestone_id) ON DELETE CASCADE
 );
+-- Databases from before job EXP was tracked
+ALTER TABLE xiv_char_jobs ADD COLUMN IF NOT EXISTS job_exp BIGINT;
+ALTER TABLE xiv_char_jobs ADD COLUMN IF NOT EXISTS job_exp_max BIGINT;
 
 -- Crafting tome progression
 CREATE TABLE IF NOT EXISTS xiv_char_crafting (
@@ -117,6 +160,45 @@ CREATE TABLE IF NOT EXISTS xiv_char_crafting (
     FOREIGN KEY (lodestone_id) REFERENCES xiv_char (lodestone_id) ON DELETE CASCADE
 );
 
+-- Background refresh bookkeeping, one row per linked character (the scheduler resumes from here after a restart)
+CREATE TABLE IF NOT EXISTS xiv_char_refresh (
+    id SERIAL, -- UID
+    lodestone_id BIGINT PRIMARY KEY, -- Lodestone character number
+    refreshed_at TIMESTAMP WITH TIME ZONE, -- Last time a refresh went through
+    attempted_at TIMESTAMP WITH TIME ZONE, -- Last time we tried, successful or not
+    failures INTEGER DEFAULT 0, -- Failed attempts in a row
+    last_error TEXT, -- What went wrong last time
+    next_attempt_at TIMESTAMP WITH TIME ZONE, -- Backing off after failures, nothing happens before this
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    edited_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (lodestone_id) REFERENCES xiv_char (lodestone_id) ON DELETE CASCADE
+);
+
+-- Achievement history, any character we track (FC members needn't be linked)
+CREATE TABLE IF NOT EXISTS xiv_char_achievements (
+    id SERIAL, -- UID
+    lodestone_id BIGINT, -- Lodestone character number
+    achievement_id INTEGER, -- Lodestone achievement number
+    achievement_name TEXT, -- Name as the Lodestone showed it
+    achieved_at TIMESTAMP WITH TIME ZONE, -- When they got it
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    edited_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (lodestone_id, achievement_id)
+);
+
+-- Free Company roster as of the last sync, diffed against the Lodestone so only changes get written
+CREATE TABLE IF NOT EXISTS xiv_fc_roster (
+    id SERIAL, -- UID
+    fc_id TEXT, -- Lodestone Free Company number, 19 digits is past what BIGINT holds
+    lodestone_id BIGINT, -- Lodestone character number, not necessarily linked to anyone here
+    character_name TEXT, -- Name as shown on the member list
+    fc_rank TEXT, -- e.g., 'Guildmaster', 'Member', etc.
+    fc_rank_icon TEXT, -- Rank icon URL
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- When we first saw them in the FC
+    edited_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fc_id, lodestone_id)
+);
+
 -- Community events and activities
 CREATE TABLE IF NOT EXISTS xiv_community_events (
     id SERIAL, -- UID
@@ -167,3 +167,271 @@ async def get_roles_by_category(category: str):
     """
     async with _pool.acquire() as conn: # type: ignore
         return await conn.fetch(query, category)
+
+async def get_role_ids_by_category(category: str):
+    ensure_pool()
+    query = """
+        SELECT role_id, role_name FROM discord_roles
+        WHERE category = $1
+    """
+    async with _pool.acquire() as conn: # type: ignore
+        return await conn.fetch(query, category)
+
+###########################
+### Bulk Character Data ###
+###########################
+
+# One row per statement is fine for a verification, not for a whole FC's job levels. These stage everything in a temp table
+# with COPY and merge it in with a single INSERT ... ON CONFLICT, and only rows whose values changed get written (and edited_at).
+# The staging tables are ON COMMIT DELETE ROWS, so the merge_* helpers need to run inside a transaction.
+
+async def _copy_merge(conn, staging: str, columns: str, records: list, merge: str) -> int:
+    await conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} ({columns}) ON COMMIT DELETE ROWS")
+    await conn.copy_records_to_table(staging, records=records)
+    status = await conn.execute(merge)
+    await conn.execute(f"TRUNCATE {staging}")  # in case the caller merges more in the same transaction
+    return int(status.split()[-1])  # "INSERT 0 <rows written>"
+
+# records: (lodestone_id, job_name, job_level, job_exp, job_exp_max), returns how many rows were inserted or changed
+async def merge_char_jobs(conn, records: list) -> int:
+    return await _copy_merge(
+        conn,
+        "stage_char_jobs",
+        "lodestone_id BIGINT, job_name TEXT, job_level INTEGER, job_exp BIGINT, job_exp_max BIGINT",
+        records,
+        """
+            INSERT INTO xiv_char_jobs (lodestone_id, job_name, job_level, job_exp, job_exp_max)
+            SELECT DISTINCT ON (lodestone_id, job_name) lodestone_id, job_name, job_level, job_exp, job_exp_max
+            FROM stage_char_jobs
+            ON CONFLICT (lodestone_id, job_name) DO UPDATE
+                SET job_level = EXCLUDED.job_level, job_exp = EXCLUDED.job_exp, job_exp_max = EXCLUDED.job_exp_max,
+                    edited_at = CURRENT_TIMESTAMP
+                WHERE (xiv_char_jobs.job_level, xiv_char_jobs.job_exp, xiv_char_jobs.job_exp_max)
+                    IS DISTINCT FROM (EXCLUDED.job_level, EXCLUDED.job_exp, EXCLUDED.job_exp_max)
+        """,
+    )
+
+# records: (lodestone_id, rank_type, rank_value), returns how many rows were inserted or changed
+async def merge_char_field_ops(conn, records: list) -> int:
+    return await _copy_merge(
+        conn,
+        "stage_char_field_ops",
+        "lodestone_id BIGINT, rank_type TEXT, rank_value INTEGER",
+        records,
+        """
+            INSERT INTO xiv_char_field_ops (lodestone_id, rank_type, rank_value)
+            SELECT DISTINCT ON (lodestone_id, rank_type) lodestone_id, rank_type, rank_value
+            FROM stage_char_field_ops
+            ON CONFLICT (lodestone_id, rank_type) DO UPDATE
+                SET rank_value = EXCLUDED.rank_value, edited_at = CURRENT_TIMESTAMP
+                WHERE xiv_char_field_ops.rank_value IS DISTINCT FROM EXCLUDED.rank_value
+        """,
+    )
+
+# Standalone versions, each its own transaction
+async def upsert_char_jobs(records: list) -> int:
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        async with conn.transaction():
+            return await merge_char_jobs(conn, records)
+
+async def upsert_char_field_ops(records: list) -> int:
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        async with conn.transaction():
+            return await merge_char_field_ops(conn, records)
+
+##############################
+### Character Verification ###
+##############################
+
+# Link a verified character to its Discord user, a character that was linked to someone else moves over
+async def link_character(lodestone_id: int, discord_id: int, forename: str, surname: str, server_name: str, data_center_name: str):
+    await execute(
+        """
+        INSERT INTO xiv_char
+            (lodestone_id, discord_id, forename, surname, server_name, data_center_name)
+        VALUES
+            ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (lodestone_id) DO UPDATE
+            SET discord_id = EXCLUDED.discord_id
+        """,
+        lodestone_id, discord_id, forename, surname, server_name, data_center_name,
+    )
+
+async def is_character_linked(lodestone_id: int, discord_id: int) -> bool:
+    return bool(await fetchval(
+        "SELECT EXISTS (SELECT 1 FROM xiv_char WHERE lodestone_id = $1 AND discord_id = $2)", lodestone_id, discord_id
+    ))
+
+###########################
+### Character Refreshes ###
+###########################
+
+# Linked characters due a refresh: stale ones, never refreshed ones, and active people's on a shorter leash
+async def fetch_due_characters(stale_after, active_ids: list, active_after, limit: int):
+    ensure_pool()
+    query = """
+        SELECT c.lodestone_id, c.discord_id, r.refreshed_at
+        FROM xiv_char c
+        LEFT JOIN xiv_char_refresh r ON r.lodestone_id = c.lodestone_id
+        WHERE c.discord_id IS NOT NULL
+          AND (r.next_attempt_at IS NULL OR r.next_attempt_at <= CURRENT_TIMESTAMP)
+          AND (
+              r.refreshed_at IS NULL
+              OR r.refreshed_at < CURRENT_TIMESTAMP - $1::interval
+              OR (c.discord_id = ANY($2::bigint[]) AND r.refreshed_at < CURRENT_TIMESTAMP - $3::interval)
+          )
+        ORDER BY r.refreshed_at ASC NULLS FIRST
+        LIMIT $4
+    """
+    async with _pool.acquire() as conn: # type: ignore
+        return await conn.fetch(query, stale_after, active_ids, active_after, limit)
+
+# Abbreviation + full name of every job, so 'DARKKNIGHT' off the classjob page can become 'DRK'
+async def fetch_job_names():
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        return await conn.fetch("SELECT job_name, full_name FROM xiv_jobs")
+
+# Write one batch of refresh results in a single transaction, checkpoints included so a restart carries on from here
+# Rows that didn't change are left alone, edited_at included
+async def save_character_refreshes(characters: list, jobs: list, field_ops: list, refreshed: list, failed: list, backoff_base, backoff_cap):
+    """
+    characters: (lodestone_id, forename, surname, server_name, data_center_name)
+    jobs: (lodestone_id, job_name, job_level, job_exp, job_exp_max)
+    field_ops: (lodestone_id, rank_type, rank_value)
+    refreshed: lodestone_ids that went through
+    failed: (lodestone_id, error text), each gets its failure count bumped and backs off base * 2^failures, capped
+    """
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        async with conn.transaction():
+            if characters:
+                await conn.executemany("""
+                    UPDATE xiv_char
+                    SET forename = $2, surname = $3, server_name = COALESCE($4, server_name),
+                        data_center_name = COALESCE($5, data_center_name), edited_at = CURRENT_TIMESTAMP
+                    WHERE lodestone_id = $1
+                      AND (forename, surname, server_name, data_center_name)
+                          IS DISTINCT FROM ($2, $3, COALESCE($4, server_name), COALESCE($5, data_center_name))
+                """, characters)
+            if jobs:
+                await merge_char_jobs(conn, jobs)
+            if field_ops:
+                await merge_char_field_ops(conn, field_ops)
+            if refreshed:
+                await conn.execute("""
+                    INSERT INTO xiv_char_refresh (lodestone_id, refreshed_at, attempted_at, failures)
+                    SELECT id, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 0 FROM unnest($1::bigint[]) AS id
+                    ON CONFLICT (lodestone_id) DO UPDATE
+                        SET refreshed_at = CURRENT_TIMESTAMP, attempted_at = CURRENT_TIMESTAMP, failures = 0,
+                            last_error = NULL, next_attempt_at = NULL, edited_at = CURRENT_TIMESTAMP
+                """, refreshed)
+            if failed:
+                await conn.executemany("""
+                    INSERT INTO xiv_char_refresh (lodestone_id, attempted_at, failures, last_error, next_attempt_at)
+                    VALUES ($1, CURRENT_TIMESTAMP, 1, $2, CURRENT_TIMESTAMP + $3::interval)
+                    ON CONFLICT (lodestone_id) DO UPDATE
+                        SET attempted_at = CURRENT_TIMESTAMP,
+                            failures = xiv_char_refresh.failures + 1,
+                            last_error = EXCLUDED.last_error,
+                            next_attempt_at = CURRENT_TIMESTAMP + LEAST($3::interval * power(2, LEAST(xiv_char_refresh.failures, 16)), $4::interval),
+                            edited_at = CURRENT_TIMESTAMP
+                """, [(lodestone_id, error, backoff_base, backoff_cap) for lodestone_id, error in failed])
+
+# Where the refresh stands overall, for the admin commands
+async def fetch_refresh_summary(stale_after):
+    ensure_pool()
+    query = """
+        SELECT
+            COUNT(*) AS linked,
+            COUNT(r.refreshed_at) AS refreshed,
+            COUNT(*) FILTER (WHERE r.refreshed_at IS NULL OR r.refreshed_at < CURRENT_TIMESTAMP - $1::interval) AS stale,
+            COUNT(*) FILTER (WHERE r.failures > 0) AS failing,
+            MIN(r.refreshed_at) AS oldest
+        FROM xiv_char c
+        LEFT JOIN xiv_char_refresh r ON r.lodestone_id = c.lodestone_id
+        WHERE c.discord_id IS NOT NULL
+    """
+    async with _pool.acquire() as conn: # type: ignore
+        return await conn.fetchrow(query, stale_after)
+
+###########################
+### Free Company Roster ###
+###########################
+
+# The roster as we last saw it
+async def fetch_fc_roster(fc_id: int):
+    ensure_pool()
+    query = """
+        SELECT lodestone_id, character_name, fc_rank, fc_rank_icon
+        FROM xiv_fc_roster
+        WHERE fc_id = $1
+    """
+    async with _pool.acquire() as conn: # type: ignore
+        return await conn.fetch(query, str(fc_id))
+
+# Write a roster diff in one go, joined/changed rows are (lodestone_id, character_name, fc_rank, fc_rank_icon)
+async def apply_fc_roster_diff(fc_id: int, joined: list, left: list, changed: list):
+    ensure_pool()
+    fc_id = str(fc_id)  # stored as TEXT, FC IDs don't fit in a BIGINT
+    async with _pool.acquire() as conn: # type: ignore
+        async with conn.transaction():
+            if joined:
+                await conn.executemany("""
+                    INSERT INTO xiv_fc_roster (fc_id, lodestone_id, character_name, fc_rank, fc_rank_icon)
+                    VALUES ($1, $2, $3, $4, $5)
+                    ON CONFLICT (fc_id, lodestone_id) DO UPDATE
+                        SET character_name = EXCLUDED.character_name, fc_rank = EXCLUDED.fc_rank,
+                            fc_rank_icon = EXCLUDED.fc_rank_icon, edited_at = CURRENT_TIMESTAMP
+                """, [(fc_id, *row) for row in joined])
+            if left:
+                await conn.execute(
+                    "DELETE FROM xiv_fc_roster WHERE fc_id = $1 AND lodestone_id = ANY($2::bigint[])",
+                    fc_id, left,
+                )
+            if changed:
+                await conn.executemany("""
+                    UPDATE xiv_fc_roster
+                    SET character_name = $3, fc_rank = $4, fc_rank_icon = $5, edited_at = CURRENT_TIMESTAMP
+                    WHERE fc_id = $1 AND lodestone_id = $2
+                """, [(fc_id, *row) for row in changed])
+
+# lodestone_id -> discord_id for whichever of these characters are linked
+async def fetch_linked_discord_ids(lodestone_ids: list) -> dict:
+    ensure_pool()
+    query = """
+        SELECT lodestone_id, discord_id FROM xiv_char
+        WHERE lodestone_id = ANY($1::bigint[]) AND discord_id IS NOT NULL
+    """
+    async with _pool.acquire() as conn: # type: ignore
+        return {row["lodestone_id"]: row["discord_id"] for row in await conn.fetch(query, lodestone_ids)}
+
+####################
+### Achievements ###
+####################
+
+# Every achievement we've recorded for a character, so a sync knows where to stop
+async def fetch_achievement_ids(lodestone_id: int) -> set:
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        rows = await conn.fetch("SELECT achievement_id FROM xiv_char_achievements WHERE lodestone_id = $1", lodestone_id)
+    return {row["achievement_id"] for row in rows}
+
+# records: (lodestone_id, achievement_id, achievement_name, achieved_at), a backfill can be thousands so it goes through COPY
+async def save_achievements(records: list) -> int:
+    ensure_pool()
+    async with _pool.acquire() as conn: # type: ignore
+        async with conn.transaction():
+            return await _copy_merge(
+                conn,
+                "stage_char_achievements",
+                "lodestone_id BIGINT, achievement_id INTEGER, achievement_name TEXT, achieved_at TIMESTAMP WITH TIME ZONE",
+                records,
+                """
+                    INSERT INTO xiv_char_achievements (lodestone_id, achievement_id, achievement_name, achieved_at)
+                    SELECT lodestone_id, achievement_id, achievement_name, achieved_at FROM stage_char_achievements
+                    ON CONFLICT (lodestone_id, achievement_id) DO NOTHING
+                """,
+            )
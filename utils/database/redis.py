@@ -20,4 +20,30 @@ async def get_verification(user_id: int) -> str | None:
     return await redis_pool.get(f"verify:{user_id}")
 
 async def delete_verification(user_id: int) -> None:
-    await redis_pool.delete(f"verify:{user_id}")
\ No newline at end of file
+    await redis_pool.delete(f"verify:{user_id}")
+
+async def get_verification_ttl(user_id: int) -> int:
+    """Seconds left on the user's token, 0 if there isn't one."""
+    return max(await redis_pool.ttl(f"verify:{user_id}"), 0)
+
+# helpers for the Lodestone page cache (utils/lodestone_scraper/pagecache.py)
+async def get_lodestone_page(url: str) -> dict | None:
+    """Return the cached page hash for this URL (or None if we've never stored it)."""
+    page = await redis_pool.hgetall(f"lodestone:page:{url}")
+    return page or None
+
+async def set_lodestone_page(url: str, page: dict, keep_for: int) -> None:
+    """Store/refresh a cached page hash, the whole key expires after <keep_for> seconds."""
+    key = f"lodestone:page:{url}"
+    async with redis_pool.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping=page)
+        pipe.expire(key, keep_for)
+        await pipe.execute()
+
+def lodestone_fetch_lock(url: str, timeout: float):
+    """Cross-process lock held while one bot process downloads this page for everyone."""
+    return redis_pool.lock(f"lodestone:lock:{url}", timeout=timeout)
+
+async def lodestone_fetch_locked(url: str) -> bool:
+    """True while some process still holds the fetch lock for this page."""
+    return bool(await redis_pool.exists(f"lodestone:lock:{url}"))
@@ -0,0 +1,70 @@
+"""
+Incremental achievement sync.
+The Lodestone lists a character's achievements newest first, so once we've seen one we already have, everything after it
+is old news. A character we know nothing about gets a full backfill with pages fetched a few at a time, after that a sync
+reads page after page only until it hits a known achievement, which is usually somewhere on page one.
+"""
+
+import asyncio
+import contextlib
+import logging
+
+from utils.database import postgres
+from utils.lodestone_scraper.errors import LodestoneHTTPError
+from utils.lodestone_scraper.scraper import LodestoneScraper
+
+logger = logging.getLogger("bot")
+
+BACKFILL_WINDOW = 4  # pages fetched at once on a first sync
+DEFAULT_CONCURRENCY = 3  # characters synced at once by sync_many
+
+
+async def sync_character(lodestone_id: int, scraper: LodestoneScraper | None = None) -> int | None:
+    """
+    Records any achievements the character earned since the last sync, returns how many (None if their achievements are private).
+    It's all or nothing: if a page fails nothing is saved, a half-saved run would leave a gap the next sync stops short of.
+    """
+    scraper = scraper or LodestoneScraper()
+    known = await postgres.fetch_achievement_ids(lodestone_id)
+    window = 1 if known else BACKFILL_WINDOW  # one page at a time when we expect to stop early, no point prefetching
+
+    new = []
+    try:
+        async with contextlib.aclosing(scraper.iter_pages("profile.achievements", lodestone_id, window=window, records=True)) as entries:
+            async for entry in entries:
+                if entry.ID is None or entry.ID.ID is None:
+                    continue
+                if entry.ID.ID in known:
+                    break  # caught up, the rest we already have
+                new.append((lodestone_id, entry.ID.ID, _name(entry.NAME), entry.TIME.Timestamp if entry.TIME is not None else None))
+    except LodestoneHTTPError as exc:
+        if exc.status == 403:
+            return None  # achievements set to private
+        raise
+
+    if new:
+        await postgres.save_achievements(new)
+    return len(new)
+
+async def sync_many(lodestone_ids, concurrency: int = DEFAULT_CONCURRENCY, scraper: LodestoneScraper | None = None) -> dict:
+    """
+    Syncs a bunch of characters (the whole FC, say), a few at a time. Returns {lodestone_id: new count, None, or the exception}.
+    """
+    scraper = scraper or LodestoneScraper()
+    budget = asyncio.Semaphore(concurrency)
+
+    async def one(lodestone_id):
+        async with budget:
+            try:
+                return await sync_character(lodestone_id, scraper)
+            except Exception as exc:
+                logger.warning("Achievement sync of %s failed: %s: %s", lodestone_id, type(exc).__name__, exc)
+                return exc
+
+    lodestone_ids = list(lodestone_ids)
+    results = await asyncio.gather(*(one(lodestone_id) for lodestone_id in lodestone_ids))
+    return dict(zip(lodestone_ids, results))
+
+def _name(found):
+    # English/French/Japanese pages fill Name, the German page words it differently and fills NameDE
+    return (found.Name or found.NameDE) if found is not None else None
@@ -0,0 +1,125 @@
+"""
+Free Company (and PvP team) crests as one image.
+The Lodestone draws a crest as three stacked layer images (BOTTOM, MIDDLE, TOP), an embed wants a single picture.
+The layers get downloaded through the pooled client, composited once with Pillow, and the PNG lands in a disk cache
+named after a hash of the three layer URLs. Same layers means same file, so every member of an FC shares one crest
+and after the first render it's just a file read.
+
+    path = await crest.get_crest(character.FREE_COMPANY.ICON_LAYERS)
+    if path:
+        embed.set_thumbnail(url=f"attachment://{path.name}")
+        await ctx.send(embed=embed, file=discord.File(path, filename=path.name))
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import aiohttp
+from PIL import Image
+
+import settings
+from utils.lodestone_scraper import httpclient
+from utils.lodestone_scraper.errors import LodestoneHTTPError
+from utils.lodestone_scraper.singleflight import SingleFlight
+
+logger = logging.getLogger("bot")
+
+LAYER_KEYS = ("BOTTOM", "MIDDLE", "TOP")  # bottom first, that's the paint order
+
+_flights = SingleFlight()  # a crowd asking for the same new crest composites it once
+stats = Counter()  # hits, composited, failed
+
+
+def layer_urls(layers) -> tuple:
+    """
+    The three layer URLs, bottom to top, from an ICON_LAYERS / CREST_LAYERS record or dict. Missing layers are None.
+    """
+    if layers is None:
+        return (None, None, None)
+    if isinstance(layers, dict):
+        return tuple(layers.get(key) for key in LAYER_KEYS)
+    return tuple(getattr(layers, key, None) for key in LAYER_KEYS)
+
+def crest_key(urls) -> str:
+    # Content address, the layer URLs are what makes a crest
+    return hashlib.sha256("\n".join(url or "" for url in urls).encode()).hexdigest()
+
+def crest_path(urls) -> Path:
+    key = crest_key(urls)
+    return Path(settings.LODESTONE_CREST_DIR) / key[:2] / f"{key}.png"
+
+async def get_crest(layers, session: aiohttp.ClientSession | None = None) -> Path | None:
+    """
+    Path to the composited crest PNG, making it first if nobody asked for this crest before.
+    None if there are no layers at all (no FC, or the page didn't show a crest).
+    """
+    urls = layer_urls(layers)
+    if not any(urls):
+        return None
+    path = crest_path(urls)
+    if path.exists():
+        stats["hits"] += 1
+        return path
+    return await _flights.do(path.name, lambda: _make_crest(urls, path, session))
+
+async def _make_crest(urls, path: Path, session) -> Path:
+    if path.exists():
+        return path  # someone beat us to it while we were queued up
+    try:
+        async with _session_scope(session) as session:
+            images = await asyncio.gather(*(_download(session, url) for url in urls if url))
+        await asyncio.to_thread(_write_crest, images, path)
+    except Exception:
+        stats["failed"] += 1
+        raise
+    stats["composited"] += 1
+    logger.debug("Composited crest %s", path.name)
+    return path
+
+async def _download(session, url) -> bytes:
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            raise LodestoneHTTPError(resp.status, url)
+        return await resp.read()
+
+@asynccontextmanager
+async def _session_scope(session):
+    # Same deal as the scraper: the session we were handed, the bot-wide pool, or a throwaway one for scripts
+    session = session or httpclient.get_session()
+    if session is not None:
+        yield session
+        return
+    session = aiohttp.ClientSession()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+def _write_crest(images, path: Path):
+    crest = _composite(images)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so a half-written file never looks like a cached crest
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    crest.save(temp, format="PNG", optimize=True)
+    os.replace(temp, path)
+
+def _composite(images) -> Image.Image:
+    """
+    Stacks the layer images bottom to top. Layers that aren't the size of the bottom one get scaled to it.
+    """
+    crest = None
+    for data in images:
+        layer = Image.open(io.BytesIO(data)).convert("RGBA")
+        if crest is None:
+            crest = layer
+            continue
+        if layer.size != crest.size:
+            layer = layer.resize(crest.size, Image.LANCZOS)
+        crest.alpha_composite(layer)
+    return crest
@@ -0,0 +1,356 @@
+"""
+Background refresh of every linked character.
+xiv_char is written once at verification, this keeps it (and the job and field ops tables hanging off it) up to date.
+Every few minutes a planner pass picks out who's due, workers scrape their character and class/job pages under a small
+concurrency budget, and results go back to the database in batches along with the refresh checkpoint, so a restart
+carries on from where we were instead of starting over.
+Interactive scrapes share the same rate limiter, workers step aside whenever it has a queue so the bot never feels slow.
+"""
+
+import asyncio
+import dataclasses
+import heapq
+import itertools
+import logging
+import re
+import time
+from collections import Counter
+from datetime import timedelta
+
+from utils.database import postgres
+from utils.lodestone_scraper import breaker, ratelimit
+from utils.lodestone_scraper.errors import LodestoneUnavailable, RateLimitDeadlineExceeded
+from utils.lodestone_scraper.scraper import LodestoneScraper
+
+logger = logging.getLogger("bot")
+
+_scheduler = None
+
+DEFAULT_CADENCE = timedelta(hours=12)        # how old a refresh gets before it's due again
+DEFAULT_ACTIVE_CADENCE = timedelta(hours=2)  # ...or this old for someone who's been around lately
+DEFAULT_CONCURRENCY = 3                      # characters being scraped at once, tops
+ACTIVE_WINDOW = 3600                         # seconds since someone's last message for them to count as active
+PLAN_INTERVAL = 300                          # seconds between looks for characters that came due
+PLAN_LIMIT = 200                             # most characters queued per look
+BATCH_SIZE = 25                              # characters per write transaction
+FLUSH_INTERVAL = 30                          # seconds, a part batch gets written after this long anyway
+YIELD_WAIT = 2.0                             # seconds of rate limiter queue that means interactive scrapes are waiting
+MAX_WAIT = 30                                # seconds a refresh scrape will queue in the rate limiter before trying later
+BACKOFF_BASE = timedelta(minutes=15)         # after a failed refresh, doubled for each failure in a row
+BACKOFF_CAP = timedelta(hours=24)
+
+REFRESH_SELECTORS = ["profile.character", "profile.classjob"]
+FIELD_OPS = ("BOZJA", "EUREKA")  # classjob.json blocks that are field ops ranks rather than jobs
+
+# Lower goes first
+PRIORITY_ON_DEMAND = 0
+PRIORITY_ACTIVE = 1
+PRIORITY_NEW = 2
+PRIORITY_STALE = 3
+
+
+class RefreshScheduler:
+    """
+    Priority queue of characters to refresh plus the workers draining it.
+    On-demand requests beat recently active people, who beat never-refreshed characters, who beat the merely stale
+    (oldest first).
+    """
+
+    def __init__(
+        self,
+        cadence: timedelta = DEFAULT_CADENCE,
+        active_cadence: timedelta = DEFAULT_ACTIVE_CADENCE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        scraper: LodestoneScraper | None = None,
+    ):
+        self.cadence = cadence
+        self.active_cadence = active_cadence
+        self.concurrency = concurrency
+        self.scraper = scraper or LodestoneScraper()
+        self.stats = Counter()
+        self.last_flush = None  # monotonic time of the last batch written
+        self._heap = []  # (priority, staleness, tiebreak, lodestone_id)
+        self._queued = {}  # lodestone_id -> best priority it's queued at, heap entries that don't match are leftovers
+        self._order = itertools.count()
+        self._ready = asyncio.Event()
+        self._in_flight = set()
+        self._saving = set()  # ids in the batch being written right now
+        self._active = {}  # discord_id -> monotonic time they were last seen
+        self._job_names = {}  # 'DARKKNIGHT' -> 'DRK', reloaded every planner pass
+        self._unmapped_jobs = set()  # classjob keys with no xiv_jobs row that we've already warned about
+        self._batch = _Batch()
+        self._flush_lock = asyncio.Lock()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._planner()), asyncio.create_task(self._flusher())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()  # whatever finished before we stopped still counts
+
+    def request(self, lodestone_id: int) -> bool:
+        """
+        Queues a character to go next, returns False if it's already being refreshed.
+        """
+        return self._push(lodestone_id, PRIORITY_ON_DEMAND, 0.0)
+
+    def mark_active(self, discord_id: int):
+        self._active[discord_id] = time.monotonic()
+
+    def status(self) -> dict:
+        return {
+            "queued": len(self._queued),
+            "in_flight": len(self._in_flight),
+            "unsaved": len(self._batch),
+            "active_users": len(self._active),
+            "refreshed": self.stats["refreshed"],
+            "failed": self.stats["failed"],
+            "deferred": self.stats["deferred"],
+            "paused": self.stats["paused"],
+            "lodestone_down_for": round(breaker.breaker_for(self.scraper.host).retry_in()),
+            "last_flush_ago": round(time.monotonic() - self.last_flush) if self.last_flush else None,
+        }
+
+    ### Queue ###
+
+    def _busy(self, lodestone_id) -> bool:
+        # Being scraped, or scraped and waiting for its batch to be written, so the checkpoint doesn't show it yet
+        return lodestone_id in self._in_flight or lodestone_id in self._batch.ids or lodestone_id in self._saving
+
+    def _push(self, lodestone_id, priority, staleness) -> bool:
+        if self._busy(lodestone_id):
+            return False
+        current = self._queued.get(lodestone_id)
+        if current is not None and current <= priority:
+            return True
+        self._queued[lodestone_id] = priority
+        heapq.heappush(self._heap, (priority, staleness, next(self._order), lodestone_id))
+        self._ready.set()
+        return True
+
+    async def _next(self):
+        while True:
+            while self._heap:
+                priority, _, _, lodestone_id = heapq.heappop(self._heap)
+                if self._queued.get(lodestone_id) == priority:
+                    del self._queued[lodestone_id]
+                    return priority, lodestone_id
+            self._ready.clear()
+            await self._ready.wait()
+
+    ### Planner ###
+
+    async def _planner(self):
+        while True:
+            try:
+                await self._plan()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Character refresh planning failed, trying again next pass")
+            await asyncio.sleep(PLAN_INTERVAL)
+
+    async def _plan(self):
+        # Every pass, it's one small query and a job added to xiv_jobs gets picked up without a restart
+        rows = await postgres.fetch_job_names()
+        self._job_names = {_squash(row["full_name"]): row["job_name"] for row in rows}
+        self._unmapped_jobs.difference_update(self._job_names)  # ones that got a row can warn again if they ever lose it
+
+        now = time.monotonic()
+        self._active = {discord_id: seen for discord_id, seen in self._active.items() if now - seen < ACTIVE_WINDOW}
+        rows = await postgres.fetch_due_characters(self.cadence, list(self._active), self.active_cadence, PLAN_LIMIT)
+        for row in rows:
+            refreshed_at = row["refreshed_at"]
+            if row["discord_id"] in self._active:
+                priority = PRIORITY_ACTIVE
+            elif refreshed_at is None:
+                priority = PRIORITY_NEW
+            else:
+                priority = PRIORITY_STALE
+            self._push(row["lodestone_id"], priority, refreshed_at.timestamp() if refreshed_at else 0.0)
+        if rows:
+            logger.info("Character refresh: %s characters due, %s queued", len(rows), len(self._queued))
+
+    ### Workers ###
+
+    async def _worker(self):
+        while True:
+            priority, lodestone_id = await self._next()
+            self._in_flight.add(lodestone_id)
+            try:
+                await self._wait_for_lodestone()
+                await self._make_way()
+                results = await self.scraper.scrape_many(REFRESH_SELECTORS, lodestone_id, max_wait=MAX_WAIT, records=True)
+            except LodestoneUnavailable as exc:
+                # Maintenance or an outage, that's not this character's fault, so no failure gets recorded
+                self.stats["paused"] += 1
+                self._in_flight.discard(lodestone_id)
+                await asyncio.sleep(max(exc.retry_in, breaker.PROBE_POLL))
+                self._push(lodestone_id, priority, 0.0)
+                continue
+            except RateLimitDeadlineExceeded as exc:
+                # The limiter's busy with more important things, give it a while and go back in the queue
+                self.stats["deferred"] += 1
+                self._in_flight.discard(lodestone_id)
+                await asyncio.sleep(min(exc.wait, MAX_WAIT))
+                self._push(lodestone_id, priority, 0.0)
+                continue
+            except asyncio.CancelledError:
+                self._in_flight.discard(lodestone_id)
+                raise
+            except Exception as exc:
+                logger.warning("Character refresh of %s failed: %s: %s", lodestone_id, type(exc).__name__, exc)
+                self._batch.fail(lodestone_id, f"{type(exc).__name__}: {exc}")
+            else:
+                self._batch.add(lodestone_id, results, self._job_names)
+            self._in_flight.discard(lodestone_id)
+            if len(self._batch) >= BATCH_SIZE:
+                await self.flush()
+
+    async def _wait_for_lodestone(self):
+        # While Lodestone's circuit is open, wait until it's due a probe instead of failing everyone in the queue
+        circuit = breaker.breaker_for(self.scraper.host)
+        while (wait := circuit.retry_in()) > 0:
+            await asyncio.sleep(wait)
+
+    async def _make_way(self):
+        # While the limiter has a queue someone interactive is probably in it, so wait that out rather than join it
+        bucket = ratelimit.bucket_for(self.scraper.host)
+        while (wait := bucket.wait_time()) > YIELD_WAIT:
+            await asyncio.sleep(wait)
+
+    ### Persistence ###
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Character refresh flush failed")
+
+    async def flush(self):
+        """
+        Writes everything finished so far in one transaction. If that fails nothing is checkpointed,
+        so those characters simply come due again on the next planner pass.
+        """
+        async with self._flush_lock:
+            batch, self._batch = self._batch, _Batch()
+            if not batch:
+                return
+            self._saving = batch.ids
+            try:
+                await postgres.save_character_refreshes(
+                    batch.characters, batch.jobs, batch.field_ops, batch.refreshed, batch.failed, BACKOFF_BASE, BACKOFF_CAP
+                )
+            except Exception:
+                logger.exception("Failed to save %s character refreshes", len(batch))
+                return
+            finally:
+                self._saving = set()
+            unmapped = batch.unmapped - self._unmapped_jobs
+            if unmapped:
+                self._unmapped_jobs |= unmapped
+                logger.warning("Character refresh: no xiv_jobs row for %s, those levels weren't saved", ", ".join(sorted(unmapped)))
+            self.stats["refreshed"] += len(batch.refreshed)
+            self.stats["failed"] += len(batch.failed)
+            self.last_flush = time.monotonic()
+            logger.info("Character refresh: saved %s refreshed, %s failed", len(batch.refreshed), len(batch.failed))
+
+
+class _Batch:
+    """
+    Rows waiting to be written, in the shapes postgres.save_character_refreshes wants.
+    """
+
+    def __init__(self):
+        self.ids = set()
+        self.characters = []
+        self.jobs = []
+        self.field_ops = []
+        self.refreshed = []
+        self.failed = []
+        self.unmapped = set()  # classjob keys skipped for having no xiv_jobs row
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, lodestone_id, results, job_names):
+        self.ids.add(lodestone_id)
+        self.refreshed.append(lodestone_id)
+        character = results.get("profile.character")
+        if character is not None and character.forename:  # no name on the page, nothing worth saving
+            self.characters.append((
+                lodestone_id, character.forename, character.surname, character.server_name or None, character.data_center_name or None
+            ))
+        classjob = results.get("profile.classjob")
+        for key in (field.name for field in dataclasses.fields(classjob)) if classjob is not None else ():
+            job = getattr(classjob, key)
+            if job is None or job.LEVEL is None:
+                continue  # not unlocked yet
+            if key in FIELD_OPS:
+                self.field_ops.append((lodestone_id, key, job.LEVEL))
+            elif key not in job_names:
+                self.unmapped.add(key)  # a raw 'PALADIN' would sit next to the real 'PLD' rows forever
+            else:
+                exp = job.EXP
+                self.jobs.append((
+                    lodestone_id, job_names[key], job.LEVEL,
+                    exp.CurrentEXP if exp is not None else None, exp.MaxEXP if exp is not None else None,
+                ))
+
+    def fail(self, lodestone_id, error: str):
+        self.ids.add(lodestone_id)
+        self.failed.append((lodestone_id, error))
+
+
+def _squash(name: str) -> str:
+    # "Dark Knight" -> "DARKKNIGHT", how classjob.json names its blocks
+    return re.sub(r"[^A-Z]", "", name.upper())
+
+###################
+### The Basics™ ###
+###################
+
+# Start refreshing in the background
+async def start(cadence: timedelta = DEFAULT_CADENCE, active_cadence: timedelta = DEFAULT_ACTIVE_CADENCE, concurrency: int = DEFAULT_CONCURRENCY):
+    global _scheduler
+    if _scheduler is not None:
+        return
+    _scheduler = RefreshScheduler(cadence, active_cadence, concurrency)
+    _scheduler.start()
+
+# Stop the workers and write whatever they finished
+async def close():
+    global _scheduler
+    if _scheduler is None:
+        return
+    scheduler, _scheduler = _scheduler, None
+    await scheduler.close()
+
+def running() -> bool:
+    return _scheduler is not None
+
+# Jump a character to the front of the queue, False if it's mid-refresh already or the scheduler isn't running
+def request_refresh(lodestone_id: int) -> bool:
+    if _scheduler is None:
+        return False
+    return _scheduler.request(lodestone_id)
+
+# Someone's about, their character gets refreshed more often for a while
+def mark_active(discord_id: int):
+    if _scheduler is not None:
+        _scheduler.mark_active(discord_id)
+
+def status() -> dict | None:
+    return _scheduler.status() if _scheduler is not None else None
+
+def cadence() -> timedelta:
+    return _scheduler.cadence if _scheduler is not None else DEFAULT_CADENCE
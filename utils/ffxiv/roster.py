@@ -0,0 +1,151 @@
+"""
+Free Company roster sync.
+Streams every member page, diffs it against the stored roster by lodestone ID, and writes only who joined, who left
+and whose rank (or name) changed, all in one transaction. Optionally moves linked members onto the Discord role in the
+fc_ranks category named after their FC rank. Members that didn't change cost no writes and no Discord calls.
+"""
+
+import asyncio
+import contextlib
+import logging
+
+import settings
+from utils.database import postgres
+from utils.lodestone_scraper.scraper import LodestoneScraper
+
+logger = logging.getLogger("bot")
+
+RANK_ROLE_CATEGORY = "fc_ranks"  # settings.CATEGORY_DICT key the rank roles are filed under
+
+_sync_lock = asyncio.Lock()  # one sync at a time, the hourly loop and ~fcsync can overlap otherwise
+
+
+class RosterDiff:
+    """
+    What changed between the stored roster and the Lodestone one.
+    joined: {lodestone_id: (name, rank, rank_icon)}, left: {lodestone_id: stored (name, rank, rank_icon)},
+    rank_changed: {lodestone_id: (old rank, new rank)}, renamed: {lodestone_id: new name}
+    """
+    __slots__ = ("joined", "left", "rank_changed", "renamed", "current", "role_changes")
+
+    def __init__(self, current: dict):
+        self.current = current
+        self.joined = {}
+        self.left = {}
+        self.rank_changed = {}
+        self.renamed = {}
+        self.role_changes = 0  # Discord members whose rank role we actually touched
+
+    def __bool__(self):
+        return bool(self.joined or self.left or self.rank_changed or self.renamed)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.current)} members: {len(self.joined)} joined, {len(self.left)} left, "
+            f"{len(self.rank_changed)} rank changes, {len(self.renamed)} renamed, {self.role_changes} Discord roles updated"
+        )
+
+
+def diff_roster(stored: dict, current: dict) -> RosterDiff:
+    """
+    Both rosters map lodestone_id -> (name, rank, rank_icon).
+    """
+    diff = RosterDiff(current)
+    stored_ids, current_ids = stored.keys(), current.keys()
+    diff.joined = {lodestone_id: current[lodestone_id] for lodestone_id in current_ids - stored_ids}
+    diff.left = {lodestone_id: stored[lodestone_id] for lodestone_id in stored_ids - current_ids}
+    for lodestone_id in stored_ids & current_ids:
+        old_name, old_rank, old_icon = stored[lodestone_id]
+        name, rank, icon = current[lodestone_id]
+        if (old_rank, old_icon) != (rank, icon):
+            diff.rank_changed[lodestone_id] = (old_rank, rank)
+        if old_name != name:
+            diff.renamed[lodestone_id] = name
+    return diff
+
+async def fetch_roster(fc_id: int, scraper: LodestoneScraper | None = None) -> dict:
+    """
+    Every member of the FC off the Lodestone, lodestone_id -> (name, rank, rank_icon). Raises if any page fails,
+    a half-read roster would look like half the FC left.
+    """
+    scraper = scraper or LodestoneScraper()
+    roster = {}
+    async with contextlib.aclosing(scraper.iter_pages("freecompany.members", fc_id, records=True)) as members:
+        async for member in members:
+            if member.ID is None or member.ID.ID is None:
+                continue
+            roster[member.ID.ID] = (member.NAME or "", member.FC_RANK or "", member.FC_RANK_ICON)
+    return roster
+
+async def sync(fc_id: int | None = None, guild=None, scraper: LodestoneScraper | None = None) -> RosterDiff:
+    """
+    Brings the stored roster in line with the Lodestone. With a guild (and FC_ROSTER_ROLES on) linked members
+    that joined, left or changed rank also get their fc_ranks role sorted out.
+    """
+    fc_id = fc_id or settings.FC_ID
+    if not fc_id:
+        raise RuntimeError("FC_ID isn't set, no idea which Free Company to sync.")
+
+    async with _sync_lock:
+        current = await fetch_roster(fc_id, scraper)
+        stored = {
+            row["lodestone_id"]: (row["character_name"], row["fc_rank"], row["fc_rank_icon"])
+            for row in await postgres.fetch_fc_roster(fc_id)
+        }
+        if not current and stored:
+            # Lodestone handed us an empty member list, that's an outage or a layout change, not everyone quitting
+            raise RuntimeError(f"Lodestone returned no members for FC {fc_id}, not touching the stored roster.")
+
+        diff = diff_roster(stored, current)
+        if not diff:
+            return diff
+
+        await postgres.apply_fc_roster_diff(
+            fc_id,
+            [(lodestone_id, *member) for lodestone_id, member in diff.joined.items()],
+            list(diff.left),
+            [(lodestone_id, *current[lodestone_id]) for lodestone_id in diff.rank_changed.keys() | diff.renamed.keys()],
+        )
+        if guild is not None and settings.FC_ROSTER_ROLES:
+            await _apply_rank_roles(guild, diff)
+        logger.info("FC roster sync for %s: %s", fc_id, diff.summary())
+        return diff
+
+async def _apply_rank_roles(guild, diff: RosterDiff):
+    """
+    Puts linked members who joined, left or changed rank on the right fc_ranks role, and only calls Discord when
+    their roles are actually wrong.
+    """
+    touched = diff.joined.keys() | diff.left.keys() | diff.rank_changed.keys()
+    linked = await postgres.fetch_linked_discord_ids(list(touched))
+    if not linked:
+        return
+
+    rank_roles = {}
+    for row in await postgres.get_role_ids_by_category(RANK_ROLE_CATEGORY):
+        role = guild.get_role(row["role_id"])
+        if role is not None:
+            rank_roles[row["role_name"].casefold()] = role
+    if not rank_roles:
+        logger.warning("FC roster sync: no roles filed under %s, skipping rank roles", RANK_ROLE_CATEGORY)
+        return
+
+    for lodestone_id, discord_id in linked.items():
+        member = guild.get_member(discord_id)
+        if member is None:
+            continue
+        rank = diff.current[lodestone_id][1] if lodestone_id in diff.current else None
+        wanted = rank_roles.get(rank.casefold()) if rank else None
+        stale = [role for role in member.roles if role in rank_roles.values() and role != wanted]
+        missing = wanted is not None and wanted not in member.roles
+        if not stale and not missing:
+            continue
+        try:
+            if stale:
+                await member.remove_roles(*stale, reason="FC rank changed on the Lodestone")
+            if missing:
+                await member.add_roles(wanted, reason="FC rank on the Lodestone")
+        except Exception:
+            logger.exception("FC roster sync: couldn't update rank roles for %s", member)
+            continue
+        diff.role_changes += 1
@@ -0,0 +1,164 @@
+"""
+Character verification: has the user put their token in their Lodestone profile yet?
+One live fetch of the character page gets the BIO (where the token goes) along with the name and world we store,
+and a poller keeps checking in the background after /whoami create, so nobody has to mash Verify while
+the Lodestone takes its time saving their profile. Identical checks running at the same time share one fetch,
+and checks for the same user or the same character take turns, so the second finds the first already did the work.
+"""
+
+import asyncio
+import logging
+import weakref
+
+from utils.database import postgres, redis
+from utils.lodestone_scraper.errors import LodestoneHTTPError, LodestoneUnavailable
+from utils.lodestone_scraper.scraper import LodestoneScraper
+from utils.lodestone_scraper.singleflight import SingleFlight
+
+logger = logging.getLogger("bot")
+
+# VerifyResult.status
+LINKED = "linked"            # token found, character linked
+NOT_YET = "not_yet"          # page fetched fine, token isn't on it (yet)
+EXPIRED = "expired"          # the token ran out (or was never there)
+SUPERSEDED = "superseded"    # the user started over with a new token
+NOT_FOUND = "not_found"      # no such character on the Lodestone
+
+POLL_FIRST = 20.0    # seconds before the first background check
+POLL_BACKOFF = 1.5   # each wait is this much longer than the last...
+POLL_MAX = 120.0     # ...up to this
+
+_checks = SingleFlight()  # identical checks running at once share one fetch
+_user_locks = weakref.WeakValueDictionary()       # discord_id -> asyncio.Lock
+_character_locks = weakref.WeakValueDictionary()  # lodestone_id -> asyncio.Lock
+_pollers = {}  # discord_id -> (lodestone_id, task)
+
+
+class VerifyResult:
+    __slots__ = ("status", "lodestone_id", "character")
+
+    def __init__(self, status: str, lodestone_id: int, character=None):
+        self.status = status
+        self.lodestone_id = lodestone_id
+        self.character = character  # profile.character record, only when we fetched one
+
+
+async def fetch_bio_and_profile(lodestone_id: int, region: str | None = None):
+    """
+    BIO and the basic profile come off the same page, so grab them in one download instead of two.
+    region defaults to the scraper's, the same host the refresh scheduler uses, so they share one rate limiter.
+    Returns (bio_text, character record).
+    """
+    scraper = LodestoneScraper(region=region)
+    character = await scraper.scrape_record(
+        "profile.character",
+        lodestone_id,
+        fields=["BIO", "NAME", "SERVER"],
+        bypass_cache=True,  # the token check has to see the live page, never a cached one
+        stream=True,  # all three are near the top, no need to read the rest of the page
+    )
+    return character.BIO or "", character
+
+async def verify(user_id: int, lodestone_id: int, token: str, region: str | None = None) -> VerifyResult:
+    """
+    Checks the character's profile for the user's token and links the character if it's there.
+    Lodestone errors (LodestoneUnavailable, LodestoneHTTPError, ...) are left for the caller.
+    """
+    return await _checks.do((user_id, lodestone_id, token), lambda: _verify(user_id, lodestone_id, token, region))
+
+async def _verify(user_id: int, lodestone_id: int, token: str, region: str | None) -> VerifyResult:
+    # Same user or same character but a different check (another ID, another user's token) waits its turn
+    async with _lock(_user_locks, user_id), _lock(_character_locks, lodestone_id):
+        pending = await redis.get_verification(user_id)
+        if pending != token:
+            # Whoever held the lock before us may well have just linked it
+            if pending is None and await postgres.is_character_linked(lodestone_id, user_id):
+                return VerifyResult(LINKED, lodestone_id)
+            return VerifyResult(EXPIRED if pending is None else SUPERSEDED, lodestone_id)
+
+        try:
+            bio, character = await fetch_bio_and_profile(lodestone_id, region)
+        except LodestoneHTTPError as exc:
+            if exc.status == 404:
+                return VerifyResult(NOT_FOUND, lodestone_id)
+            raise
+        if token not in bio:
+            return VerifyResult(NOT_YET, lodestone_id, character)
+
+        logger.debug("Verified %s as %s (%r)", user_id, lodestone_id, character)
+        await postgres.link_character(
+            lodestone_id, user_id, character.forename, character.surname, character.server_name, character.data_center_name
+        )
+        await redis.delete_verification(user_id)
+        return VerifyResult(LINKED, lodestone_id, character)
+
+def _lock(locks, key) -> asyncio.Lock:
+    lock = locks.get(key)
+    if lock is None:
+        lock = locks[key] = asyncio.Lock()
+    return lock
+
+#######################
+### Background Poll ###
+#######################
+
+def start_polling(user_id: int, lodestone_id: int, token: str, notify) -> bool:
+    """
+    Keeps checking the character until it verifies or the token runs out, then awaits notify(VerifyResult).
+    One poller per user, asking for a different character replaces it. Returns False if it was already on this one.
+    """
+    current = _pollers.get(user_id)
+    if current is not None:
+        if current[0] == lodestone_id and not current[1].done():
+            return False
+        current[1].cancel()
+    task = asyncio.create_task(_poll(user_id, lodestone_id, token, notify), name=f"verify-poll-{user_id}")
+    _pollers[user_id] = (lodestone_id, task)
+    task.add_done_callback(lambda done: _forget(user_id, done))
+    return True
+
+def stop_polling(user_id: int):
+    current = _pollers.pop(user_id, None)
+    if current is not None:
+        current[1].cancel()
+
+def polling(user_id: int) -> int | None:
+    # Which character we're watching for this user, if any
+    current = _pollers.get(user_id)
+    return current[0] if current is not None and not current[1].done() else None
+
+def _forget(user_id, task):
+    current = _pollers.get(user_id)
+    if current is not None and current[1] is task:
+        del _pollers[user_id]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Verification poller for %s died", user_id, exc_info=task.exception())
+
+async def _poll(user_id: int, lodestone_id: int, token: str, notify):
+    delay = POLL_FIRST
+    while True:
+        ttl = await redis.get_verification_ttl(user_id)
+        if ttl <= 0:
+            result = VerifyResult(EXPIRED, lodestone_id)
+            break
+        # Never sleep past the token, the last look should still be able to link them
+        await asyncio.sleep(min(delay, max(ttl - 5, 1)))
+        delay = min(delay * POLL_BACKOFF, POLL_MAX)
+
+        try:
+            result = await verify(user_id, lodestone_id, token)
+        except LodestoneUnavailable as exc:
+            delay = max(delay, exc.retry_in)  # no sense checking before the Lodestone's back
+            continue
+        except Exception as exc:
+            logger.warning("Verification poll of %s for %s failed: %s: %s", lodestone_id, user_id, type(exc).__name__, exc)
+            continue
+        if result.status != NOT_YET:
+            break
+
+    if result.status == SUPERSEDED:
+        return  # they ran /whoami create again, that run's in charge now
+    try:
+        await notify(result)
+    except Exception:
+        logger.exception("Couldn't tell %s how their verification went", user_id)
@@ -0,0 +1,329 @@
+"""
+Optional archive of every page body the scraper downloads, compressed on disk and keyed by URL and fetch time.
+When a selector breaks or a selector file grows a new field, the archived pages can be run through the current registry
+again, offline and in parallel, instead of scraping everyone over again at the Lodestone's pace:
+
+    python -m utils.lodestone_scraper.archive reextract --selector profile.classjob --latest --out classjob.jsonl
+    python -m utils.lodestone_scraper.archive stats
+    python -m utils.lodestone_scraper.archive prune --days 30
+
+Pages are gzipped, or zstd'd if the zstandard package happens to be installed. Layout is
+<dir>/<host>/<quoted path + query>/<UTC fetch time>.html.gz, so one URL's history sits in one folder.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .backends import get_backend
+from .bench import page_name
+from .extract import extract_element
+from .selectors import registry
+from .uris import applicable_uris
+
+logger = logging.getLogger("bot")
+
+_archive_dir = None
+_compression = None
+_retention_days = None
+_writes = set()  # pending background writes, so close() can wait for them
+_pruner = None
+
+DEFAULT_RETENTION_DAYS = 30
+PRUNE_INTERVAL = 24 * 3600  # seconds between retention sweeps while the bot runs
+STAMP_FORMAT = "%Y%m%dT%H%M%S%fZ"
+EXTENSIONS = {"gzip": ".html.gz", "zstd": ".html.zst"}
+
+###################
+### The Basics™ ###
+###################
+
+# Start archiving every downloaded page into directory, pruning anything older than retention_days once a day
+async def start(directory, retention_days: int | None = DEFAULT_RETENTION_DAYS, compression: str | None = None):
+    global _archive_dir, _compression, _retention_days, _pruner
+    if _archive_dir is not None:
+        return
+    compression = compression or ("zstd" if zstandard is not None else "gzip")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd archive compression needs the zstandard package, use gzip instead")
+    if compression not in EXTENSIONS:
+        raise ValueError(f"Unknown archive compression '{compression}', use 'gzip' or 'zstd'")
+    _archive_dir = Path(directory)
+    _archive_dir.mkdir(parents=True, exist_ok=True)
+    _compression = compression
+    _retention_days = retention_days
+    if retention_days is not None:
+        _pruner = asyncio.create_task(_prune_loop())
+
+# Stop archiving, after the writes already under way have landed
+async def close():
+    global _archive_dir, _pruner
+    if _archive_dir is None:
+        return
+    _archive_dir = None
+    if _pruner is not None:
+        _pruner.cancel()
+        await asyncio.gather(_pruner, return_exceptions=True)
+        _pruner = None
+    if _writes:
+        await asyncio.gather(*_writes, return_exceptions=True)
+
+def enabled() -> bool:
+    return _archive_dir is not None
+
+def record(url: str, html: str, fetched_at: datetime | None = None):
+    """
+    Archives a freshly downloaded page in the background, a no-op when the archive is off.
+    Compressing and writing happen on a thread so the scrape that fetched it doesn't wait.
+    """
+    if _archive_dir is None:
+        return
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    task = asyncio.ensure_future(asyncio.to_thread(write_page, _archive_dir, url, html, fetched_at, _compression))
+    _writes.add(task)
+    task.add_done_callback(_write_done)
+
+def _write_done(task):
+    _writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Failed to archive a Lodestone page: %s", task.exception())
+
+async def _prune_loop():
+    while True:
+        removed = await asyncio.to_thread(prune, _archive_dir, _retention_days)
+        if removed:
+            logger.info("Lodestone archive: pruned %s pages older than %s days", removed, _retention_days)
+        await asyncio.sleep(PRUNE_INTERVAL)
+
+###############
+### Storage ###
+###############
+
+def page_dir(root: Path, url: str) -> Path:
+    parts = urlsplit(url)
+    key = parts.path + (f"?{parts.query}" if parts.query else "")
+    return Path(root) / parts.netloc / quote(key, safe="")
+
+def write_page(root: Path, url: str, html: str, fetched_at: datetime, compression: str = "gzip") -> Path:
+    folder = page_dir(root, url)
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / (fetched_at.astimezone(timezone.utc).strftime(STAMP_FORMAT) + EXTENSIONS[compression])
+    data = html.encode("utf-8")
+    data = zstandard.ZstdCompressor(level=10).compress(data) if compression == "zstd" else gzip.compress(data, compresslevel=6)
+    # Write then rename, a half-written page would just be a broken archive entry
+    partial = path.with_name(path.name + ".part")
+    partial.write_bytes(data)
+    os.replace(partial, path)
+    return path
+
+def read_page(path: Path) -> str:
+    data = Path(path).read_bytes()
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd compressed and the zstandard package isn't installed")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    else:
+        data = gzip.decompress(data)
+    return data.decode("utf-8", errors="replace")
+
+class ArchivedPage:
+    """
+    One archived fetch of one URL.
+    """
+    __slots__ = ("url", "fetched_at", "path")
+
+    def __init__(self, url: str, fetched_at: datetime, path: Path):
+        self.url = url
+        self.fetched_at = fetched_at
+        self.path = path
+
+def iter_archive(root: Path, since: datetime | None = None, latest: bool = False):
+    """
+    Yields every ArchivedPage under root (only the newest per URL with latest=True), oldest first within each URL.
+    """
+    for host in sorted(Path(root).iterdir()):
+        if not host.is_dir():
+            continue
+        for folder in sorted(host.iterdir()):
+            fetches = []
+            for path in folder.iterdir():
+                stamp = _stamp_of(path)
+                if stamp is not None and (since is None or stamp >= since):
+                    fetches.append((stamp, path))
+            fetches.sort()
+            if latest:
+                fetches = fetches[-1:]
+            url = f"https://{host.name}{unquote(folder.name)}"
+            for stamp, path in fetches:
+                yield ArchivedPage(url, stamp, path)
+
+def prune(root: Path, retention_days: int, now: datetime | None = None) -> int:
+    """
+    Deletes archived pages older than retention_days, but never a URL's newest one, so re-extraction always has
+    something to work with. Returns how many files went.
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=retention_days)
+    removed = 0
+    for host in Path(root).iterdir():
+        if not host.is_dir():
+            continue
+        for folder in host.iterdir():
+            fetches = sorted((stamp, path) for path in folder.iterdir() if (stamp := _stamp_of(path)) is not None)
+            for stamp, path in fetches[:-1]:
+                if stamp < cutoff:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+    return removed
+
+def _stamp_of(path: Path):
+    for extension in EXTENSIONS.values():
+        if path.name.endswith(extension):
+            try:
+                return datetime.strptime(path.name[:-len(extension)], STAMP_FORMAT).replace(tzinfo=timezone.utc)
+            except ValueError:
+                return None
+    return None
+
+#####################
+### Re-extraction ###
+#####################
+
+def _routes() -> list:
+    # (compiled path regex capturing the IDs, page name), one per URL shape in uris.py
+    routes = {}
+    for uri_key, template in applicable_uris.items():
+        path = "/lodestone/" + template.split("/lodestone/", 1)[1]
+        pattern = "^" + re.escape(path).replace(re.escape("%s"), "([^/]+)") + "$"
+        routes[pattern] = page_name(uri_key)
+    return [(re.compile(pattern), name) for pattern, name in routes.items()]
+
+def _wanted_by_page(selector_strings: list | None) -> dict:
+    """
+    {page name: [(selector string, category, filename, keys)]}, every selector file reading that page when none are given.
+    """
+    if not selector_strings:
+        selector_strings = [f"{plan.category}.{plan.filename}" for plan in registry.plans() if plan.uri_key in applicable_uris]
+    wanted = {}
+    for selector_string in selector_strings:
+        plan, keys = registry.resolve(selector_string)
+        plan.resolve(keys)  # fail now on a typo, not in every worker
+        wanted.setdefault(page_name(plan.uri_key), []).append((selector_string, plan.category, plan.filename, keys))
+    return wanted
+
+def reextract_job(path: str, backend_name: str, wanted: list) -> dict:
+    """
+    Worker side: decompress, parse and extract one archived page. Plain data in and out so it pickles cheaply.
+    """
+    from .scraper import LodestoneScraper  # shaping rules live there, imported late to keep worker startup light
+
+    doc = get_backend(backend_name).parse(read_page(Path(path)))
+    values = {}
+    for selector_string, category, filename, keys in wanted:
+        target = registry.get(category, filename).resolve(keys)
+        values[selector_string] = LodestoneScraper._shape(keys, target, extract_element(doc, target))
+    return values
+
+def _warm_worker():
+    registry.preload(strict=False)
+
+def reextract(root: Path, selector_strings=None, since=None, latest=False, workers=None, parser="selectolax", out=sys.stdout) -> dict:
+    """
+    Runs the current selector registry over archived pages on a process pool, writing one JSON line per page to out.
+    Returns counts of what happened.
+    """
+    routes = _routes()
+    wanted = _wanted_by_page(selector_strings)
+
+    jobs = []
+    for page in iter_archive(root, since, latest):
+        path = urlsplit(page.url).path
+        match = next(((route, name) for route, name in routes if route.match(path)), None)
+        if match is None or match[1] not in wanted:
+            continue
+        route, name = match
+        jobs.append((page, name, list(route.match(path).groups())))
+
+    counts = {"pages": len(jobs), "failed": 0}
+    if not jobs:
+        return counts
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm_worker) as pool:
+        futures = [pool.submit(reextract_job, str(page.path), parser, wanted[name]) for page, name, _ in jobs]
+        for (page, name, ids), future in zip(jobs, futures):
+            line = {"url": page.url, "fetched_at": page.fetched_at.isoformat(), "page": name, "ids": ids}
+            try:
+                line["values"] = future.result()
+            except Exception as exc:
+                counts["failed"] += 1
+                line["error"] = f"{type(exc).__name__}: {exc}"
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return counts
+
+def stats(root: Path) -> dict:
+    pages, urls, size, oldest, newest = 0, set(), 0, None, None
+    for page in iter_archive(root):
+        pages += 1
+        urls.add(page.url)
+        size += page.path.stat().st_size
+        oldest = page.fetched_at if oldest is None else min(oldest, page.fetched_at)
+        newest = page.fetched_at if newest is None else max(newest, page.fetched_at)
+    return {
+        "pages": pages,
+        "urls": len(urls),
+        "bytes": size,
+        "oldest": oldest.isoformat() if oldest else None,
+        "newest": newest.isoformat() if newest else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.lodestone_scraper.archive", description="Lodestone page archive")
+    parser.add_argument("--dir", type=Path, default=Path(os.getenv("LODESTONE_ARCHIVE_DIR") or "lodestone_archive"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("reextract", help="run the current selectors over archived pages, one JSON line per page")
+    run.add_argument("--selector", action="append", help="selector string to extract (repeatable), default is every selector file")
+    run.add_argument("--since", type=datetime.fromisoformat, help="only pages fetched at or after this ISO date/time (UTC)")
+    run.add_argument("--latest", action="store_true", help="only the newest fetch of each URL")
+    run.add_argument("--workers", type=int, help="processes to use, default is one per core but one")
+    run.add_argument("--parser", choices=["bs4", "selectolax"], default="selectolax")
+    run.add_argument("--out", type=Path, help="write JSON lines here instead of stdout")
+
+    commands.add_parser("stats", help="how much is archived")
+
+    trim = commands.add_parser("prune", help="delete pages past the retention period (each URL keeps its newest)")
+    trim.add_argument("--days", type=int, default=DEFAULT_RETENTION_DAYS)
+    args = parser.parse_args(argv)
+
+    if args.command == "stats":
+        print(json.dumps(stats(args.dir), indent=2))
+    elif args.command == "prune":
+        print(f"Removed {prune(args.dir, args.days)} archived pages")
+    else:
+        since = args.since.replace(tzinfo=args.since.tzinfo or timezone.utc) if args.since else None
+        started = time.perf_counter()
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as out:
+                counts = reextract(args.dir, args.selector, since, args.latest, args.workers, args.parser, out)
+        else:
+            counts = reextract(args.dir, args.selector, since, args.latest, args.workers, args.parser)
+        print(f"Re-extracted {counts['pages']} pages ({counts['failed']} failed) in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Parser backends for the Lodestone scraper.
+extract.py never touches a parse tree directly, it goes through one of these so we can swap BeautifulSoup for selectolax.
+Both backends are expected to give identical results on our selector files.
+"""
+
+from bs4 import BeautifulSoup, Tag
+from selectolax.lexbor import LexborHTMLParser, LexborNode
+
+# Tags whose text BeautifulSoup leaves out of get_text() unless you ask the tag itself
+_NON_TEXT_TAGS = {"script", "style", "template"}
+
+
+class Document:
+    """
+    A parsed page plus the backend that parsed it, this is what extract.py works on.
+    `headings` is the field ops heading index, extract.py builds it the first time a field ops value is asked for.
+    """
+    __slots__ = ("tree", "backend", "headings")
+
+    def __init__(self, tree, backend):
+        self.tree = tree
+        self.backend = backend
+        self.headings = None
+
+
+class BeautifulSoupBackend:
+    """
+    The original BeautifulSoup + lxml engine, CSS runs through the soupsieve selectors precompiled in the registry.
+    """
+    name = "bs4"
+
+    def parse(self, html) -> Document:
+        return Document(BeautifulSoup(html, "lxml"), self)
+
+    def select(self, node, selector):
+        return selector.css.select(node)
+
+    def select_one(self, node, selector):
+        return selector.css.select_one(node)
+
+    def children(self, element) -> list:
+        return [child for child in element.children if isinstance(child, Tag)]
+
+    def tag(self, element) -> str:
+        return element.name
+
+    def text(self, element) -> str:
+        return element.get_text(strip=True)
+
+    def attribute(self, element, name: str):
+        value = element.get(name)
+        # bs4 hands back multi-valued attributes (class, rel...) as lists, flatten them like the HTML has them
+        if isinstance(value, list):
+            return " ".join(value)
+        return value
+
+    def heading_blocks(self, tree):
+        """
+        Yields (heading text, [values]) for each field ops heading, values is None if the heading has no data block.
+        """
+        for heading in tree.select("h3.heading-md"):
+            block = heading.find_next_sibling("div", class_="character__job__list")
+            values = None
+            if block:
+                values = [div.get_text(strip=True) for div in block.find_all("div", recursive=False)]
+            yield heading.get_text(strip=True), values
+
+
+class SelectolaxBackend:
+    """
+    selectolax's Lexbor engine, a lot faster and lighter than BeautifulSoup on full character pages.
+    """
+    name = "selectolax"
+
+    def parse(self, html) -> Document:
+        return Document(LexborHTMLParser(html), self)
+
+    def select(self, node, selector):
+        found = node.css(selector.selector)
+        # Lexbor counts the node itself as a match, soupsieve (and CSS scoping generally) only looks underneath it
+        if found and isinstance(node, LexborNode) and found[0].mem_id == node.mem_id:
+            return found[1:]
+        return found
+
+    def select_one(self, node, selector):
+        found = node.css_first(selector.selector)
+        if found is not None and isinstance(node, LexborNode) and found.mem_id == node.mem_id:
+            rest = self.select(node, selector)
+            return rest[0] if rest else None
+        return found
+
+    def children(self, element) -> list:
+        # iter() hands back comments too, they don't count as children for nth-child
+        return [child for child in element.iter() if not child.tag.startswith("-")]
+
+    def tag(self, element) -> str:
+        return element.tag
+
+    def text(self, element) -> str:
+        # Fast path, only walk by hand when there's something BeautifulSoup would have skipped
+        if element.tag in _NON_TEXT_TAGS or element.css_first("script, style, template") is None:
+            return element.text(strip=True)
+        return "".join(_text_parts(element))
+
+    def attribute(self, element, name: str):
+        attributes = element.attributes
+        if name not in attributes:
+            return None
+        value = attributes[name]
+        return "" if value is None else value  # valueless attributes come back as None from lexbor, bs4 says ""
+
+    def heading_blocks(self, tree):
+        """
+        Yields (heading text, [values]) for each field ops heading, values is None if the heading has no data block.
+        """
+        for heading in tree.css("h3.heading-md"):
+            block = heading.next
+            while block is not None and not _is_job_list(block):
+                block = block.next
+            values = None
+            if block is not None:
+                values = [self.text(div) for div in block.iter() if div.tag == "div"]
+            yield self.text(heading), values
+
+
+def _is_job_list(node) -> bool:
+    if node.tag != "div":
+        return False
+    return "character__job__list" in (node.attributes.get("class") or "").split()
+
+def _text_parts(element):
+    """
+    Stripped text pieces of element, skipping script/style/template like bs4's get_text does.
+    """
+    for child in element.iter(include_text=True):
+        if child.tag == "-text":
+            piece = child.text(deep=False).strip()
+            if piece:
+                yield piece
+        elif child.tag not in _NON_TEXT_TAGS and not child.tag.startswith("-"):
+            yield from _text_parts(child)
+
+
+BACKENDS = {
+    BeautifulSoupBackend.name: BeautifulSoupBackend(),
+    SelectolaxBackend.name: SelectolaxBackend(),
+}
+
+_default_backend = BACKENDS["bs4"]
+
+def get_backend(name: str | None = None):
+    """
+    Returns the backend called `name`, or the global default if no name is given.
+    """
+    if name is None:
+        return _default_backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}', pick from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+def set_default_backend(name: str):
+    """
+    Switches the parser every scraper uses unless it was given its own.
+    """
+    global _default_backend
+    _default_backend = get_backend(name)
+
+def as_document(tree) -> Document:
+    """
+    Wraps a bare BeautifulSoup/selectolax tree in a Document, so older callers passing soup keep working.
+    """
+    if isinstance(tree, Document):
+        return tree
+    if isinstance(tree, LexborHTMLParser):
+        return Document(tree, BACKENDS["selectolax"])
+    return Document(tree, BACKENDS["bs4"])
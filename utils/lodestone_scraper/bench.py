@@ -0,0 +1,435 @@
+"""
+Offline benchmarks for the Lodestone scraper.
+Replays saved Lodestone pages from fixtures/ through every parser backend and every selector file, no network involved,
+and dumps the numbers as JSON so two commits can be compared.
+
+    python -m utils.lodestone_scraper.bench record --character 12345678 --freecompany 9231... --search "Some Name"
+    python -m utils.lodestone_scraper.bench run --output before.json
+    python -m utils.lodestone_scraper.bench compare before.json after.json
+    python -m utils.lodestone_scraper.bench check
+    python -m utils.lodestone_scraper.bench snapshot
+
+`record` is the only thing that goes to the Lodestone. Next to every page it also saves what each selector file extracts
+from it (`<page>.expected.json`), `check` re-extracts with every backend and lists whatever changed since,
+so the fixtures double as a regression corpus for when Lodestone changes its markup. `snapshot` re-saves the
+`.expected.json` files from the pages already in fixtures/, for hand-edited pages or after a deliberate selector change.
+The fixtures that ship with the repo are hand-built pages shaped like the Lodestone's, no real characters in them.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows, no peak RSS for you
+    resource = None
+
+from .backends import BACKENDS, get_backend
+from .extract import extract_element
+from .selectors import registry
+from .uris import applicable_uris
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+DEFAULT_RUNS = 20
+
+#############
+### Pages ###
+#############
+
+def page_name(uri_key: str) -> str:
+    """
+    Fixture name for the page a selector file reads, e.g. profile/classjob.json -> character_class_job.
+    Selector files sharing a URL share a fixture.
+    """
+    path = applicable_uris[uri_key].split("/lodestone/", 1)[1]
+    parts = [part for part in path.split("/") if part and part != "%s"]
+    name = "_".join(parts)
+    return name if "%s" in path else f"search_{name}"
+
+def pages() -> dict:
+    """
+    {page name: [plans that read that page]} for every selector file we have.
+    """
+    grouped = {}
+    for plan in sorted(registry.plans(), key=lambda p: p.uri_key):
+        if plan.uri_key in applicable_uris:
+            grouped.setdefault(page_name(plan.uri_key), []).append(plan)
+    return grouped
+
+def _ids_for(plan) -> list:
+    # Dummy IDs to fill the URL template, replayed pages don't care what they are
+    return ["0"] * (applicable_uris[plan.uri_key].count("%s") - 1)
+
+#################
+### Measuring ###
+#################
+
+class _ReplayContent:
+    def __init__(self, body: bytes):
+        self._body = body
+        self.total_bytes = 0  # like aiohttp's StreamReader, what's been read so far
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self._body), size):
+            chunk = self._body[start:start + size]
+            self.total_bytes += len(chunk)
+            yield chunk
+
+class _ReplayResponse:
+    status = 200
+    charset = "utf-8"
+
+    def __init__(self, body: bytes):
+        self.headers = {}
+        self.content_length = len(body)
+        self.content = _ReplayContent(body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+class _ReplayTimeout:
+    connect = None
+
+class ReplaySession:
+    """
+    Stands in for an aiohttp session, answers every GET with the same fixture page.
+    """
+    timeout = _ReplayTimeout()
+
+    def __init__(self, body: bytes):
+        self._body = body
+
+    def get(self, url, **kwargs):
+        return _ReplayResponse(self._body)
+
+def _ms(samples: list) -> dict:
+    return {
+        "median": round(statistics.median(samples) * 1000, 4),
+        "min": round(min(samples) * 1000, 4),
+        "max": round(max(samples) * 1000, 4),
+    }
+
+def _peak_rss() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KB, macOS bytes
+
+def measure(fixture: str, category: str, filename: str, backend_name: str, runs: int = DEFAULT_RUNS) -> dict:
+    """
+    Benchmarks one selector file against one fixture page with one backend. Meant to run in its own process so
+    the peak RSS belongs to this case alone.
+    """
+    from .scraper import LodestoneScraper
+
+    body = Path(fixture).read_bytes()
+    html = body.decode("utf-8")
+    backend = get_backend(backend_name)
+    plan = registry.get(category, filename)
+    rss_before = _peak_rss()
+
+    # Warm up once so lazy setup (tries, imports) doesn't land in the first sample
+    extract_element(backend.parse(html), plan.root)
+
+    parse_times, extract_times = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        doc = backend.parse(html)
+        parsed = time.perf_counter()
+        extract_element(doc, plan.root)
+        parse_times.append(parsed - started)
+        extract_times.append(time.perf_counter() - parsed)
+        del doc
+
+    # Allocations get their own run, tracemalloc slows everything down too much to time alongside it.
+    # Python heap only, lexbor's own C allocations only show up in the RSS numbers.
+    tracemalloc.start()
+    doc = backend.parse(html)
+    extract_element(doc, plan.root)
+    retained, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del doc
+
+    # The whole scrape() path, body reading included, fed from memory
+    scraper = LodestoneScraper(session=ReplaySession(body), cache=False, coalesce=False, parser=backend_name)
+    async def scrapes():
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            await scraper.scrape(f"{category}.{filename}", *_ids_for(plan))
+            times.append(time.perf_counter() - started)
+        return times
+    scrape_times = asyncio.run(scrapes())
+
+    rss_after = _peak_rss()
+    return {
+        "page": Path(fixture).stem,
+        "selector_file": f"{category}/{filename}",
+        "backend": backend_name,
+        "fixture_bytes": len(body),
+        "runs": runs,
+        "parse_ms": _ms(parse_times),
+        "extract_ms": _ms(extract_times),
+        "scrape_ms": _ms(scrape_times),
+        "alloc_peak_bytes": peak,
+        "alloc_retained_bytes": retained,
+        "alloc_retained_blocks": blocks,
+        "peak_rss_bytes": rss_after,
+        "rss_growth_bytes": None if rss_after is None else rss_after - rss_before,
+    }
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _versions() -> dict:
+    from importlib.metadata import version, PackageNotFoundError
+    found = {}
+    for package in ("beautifulsoup4", "lxml", "soupsieve", "selectolax", "aiohttp"):
+        try:
+            found[package] = version(package)
+        except PackageNotFoundError:
+            found[package] = None
+    return found
+
+def run(fixtures_dir: Path, backends: list, runs: int, only: list | None = None) -> dict:
+    """
+    Benchmarks every selector file that has a fixture, each case in a fresh process. Returns the full report.
+    """
+    results, missing = [], []
+    cases = []
+    for name, plans in pages().items():
+        fixture = fixtures_dir / f"{name}.html"
+        for plan in plans:
+            key = f"{plan.category}/{plan.filename}"
+            if only and key not in only:
+                continue
+            if not fixture.exists():
+                missing.append({"selector_file": key, "fixture": fixture.name})
+                continue
+            cases.extend((str(fixture), plan.category, plan.filename, backend, runs) for backend in backends)
+
+    # One process per case, otherwise the peak RSS is just whichever case was biggest so far
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(measure, *case).result())
+        print(f"{case[1]}/{case[2]} [{case[3]}] done", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "packages": _versions(),
+            "runs": runs,
+        },
+        "results": results,
+        "missing": missing,
+    }
+
+###############
+### Compare ###
+###############
+
+def compare(before: dict, after: dict, threshold: float) -> tuple:
+    """
+    Lines comparing the medians of every (selector file, backend) in both reports,
+    plus the ones that got slower than threshold (0.1 = 10%).
+    """
+    old = {(r["selector_file"], r["backend"]): r for r in before["results"]}
+    lines, regressions = [], []
+    for result in after["results"]:
+        key = (result["selector_file"], result["backend"])
+        if key not in old:
+            continue
+        cells = []
+        for metric in ("parse_ms", "extract_ms", "scrape_ms"):
+            was, now = old[key][metric]["median"], result[metric]["median"]
+            change = (now - was) / was if was else 0.0
+            cells.append(f"{metric[:-3]} {was:.3f}->{now:.3f}ms ({change:+.0%})")
+            if change > threshold:
+                regressions.append(f"{key[0]} [{key[1]}] {metric} {change:+.0%}")
+        lines.append(f"{key[0]:<28} {key[1]:<10} " + "  ".join(cells))
+    return lines, regressions
+
+################
+### Fixtures ###
+################
+
+def expected_for(html: str, plans: list, backend_name: str = "bs4") -> dict:
+    """
+    What every selector file extracts from a page, the snapshot `check` compares against.
+    """
+    doc = get_backend(backend_name).parse(html)
+    return {f"{plan.category}/{plan.filename}": extract_element(doc, plan.root) for plan in plans}
+
+def write_snapshot(fixtures_dir: Path, name: str, html: str, plans: list):
+    snapshot = json.dumps(expected_for(html, plans), indent=2, sort_keys=True, ensure_ascii=False)
+    (fixtures_dir / f"{name}.expected.json").write_text(snapshot + "\n", encoding="utf-8")
+
+def snapshot(fixtures_dir: Path) -> list:
+    """
+    Re-saves the snapshot of every fixture page, returns the page names it wrote.
+    """
+    written = []
+    for name, plans in pages().items():
+        fixture = fixtures_dir / f"{name}.html"
+        if fixture.exists():
+            write_snapshot(fixtures_dir, name, fixture.read_text(encoding="utf-8"), plans)
+            written.append(name)
+    return written
+
+def check(fixtures_dir: Path, backends: list) -> list:
+    """
+    Re-extracts every fixture that has a snapshot, returns a line per selector file + backend that no longer matches.
+    Having nothing to check at all counts as a problem too, an empty fixture folder shouldn't pass.
+    """
+    problems = []
+    checked = 0
+    for name, plans in pages().items():
+        fixture = fixtures_dir / f"{name}.html"
+        saved = fixtures_dir / f"{name}.expected.json"
+        if not fixture.exists() or not saved.exists():
+            continue
+        html = fixture.read_text(encoding="utf-8")
+        expected = json.loads(saved.read_text(encoding="utf-8"))
+        checked += 1
+        for backend in backends:
+            # Round trip through JSON so tuples/lists etc compare like they were saved
+            got = json.loads(json.dumps(expected_for(html, plans, backend)))
+            for key, value in expected.items():
+                if got.get(key) != value:
+                    problems.append(f"{name}: {key} [{backend}] differs from the snapshot")
+    if not checked:
+        problems.append(f"No fixture pages with snapshots in {fixtures_dir}, nothing was checked")
+    return problems
+
+async def record(fixtures_dir: Path, region: str, ids: dict, search: str | None):
+    """
+    Downloads one of each page we have selectors for and saves it (plus its snapshot) as a fixture.
+    """
+    from .scraper import LodestoneScraper
+
+    scraper = LodestoneScraper(region=region, cache=False, coalesce=False)
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    async with scraper._session_scope() as session:
+        for name, plans in pages().items():
+            plan = plans[0]
+            category_id = ids.get(plan.category)
+            if name.startswith("search_"):
+                if not search:
+                    print(f"Skipping {name}, no --search term given", file=sys.stderr)
+                    continue
+                url = scraper._build_url(plan, None, (), {"q": search})
+            elif category_id is None:
+                print(f"Skipping {name}, no --{plan.category} ID given", file=sys.stderr)
+                continue
+            else:
+                url = scraper._build_url(plan, category_id, ())
+            html = await scraper._download(session, url)
+            (fixtures_dir / f"{name}.html").write_text(html, encoding="utf-8")
+            write_snapshot(fixtures_dir, name, html, plans)
+            print(f"Recorded {name} from {url}", file=sys.stderr)
+
+###########
+### CLI ###
+###########
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.lodestone_scraper.bench", description="Offline Lodestone scraper benchmarks")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR, help="fixture folder (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="benchmark every selector file that has a fixture")
+    run_cmd.add_argument("--backend", action="append", choices=list(BACKENDS), help="only this backend (repeatable)")
+    run_cmd.add_argument("--only", action="append", help="only this selector file, e.g. profile/gearset (repeatable)")
+    run_cmd.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    run_cmd.add_argument("--output", type=Path, help="write the JSON report here instead of stdout")
+
+    compare_cmd = commands.add_parser("compare", help="compare two run reports")
+    compare_cmd.add_argument("before", type=Path)
+    compare_cmd.add_argument("after", type=Path)
+    compare_cmd.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression (default 0.10)")
+
+    check_cmd = commands.add_parser("check", help="compare extraction against the recorded snapshots")
+    check_cmd.add_argument("--backend", action="append", choices=list(BACKENDS))
+
+    commands.add_parser("snapshot", help="re-save the snapshots from the fixture pages as they are")
+
+    record_cmd = commands.add_parser("record", help="download fresh fixtures from the Lodestone")
+    record_cmd.add_argument("--region", default="na")
+    record_cmd.add_argument("--character", help="character ID for the profile pages")
+    record_cmd.add_argument("--freecompany", help="free company ID")
+    record_cmd.add_argument("--pvpteam", help="PvP team ID")
+    record_cmd.add_argument("--search", help="search term for the search pages")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.fixtures, args.backend or list(BACKENDS), args.runs, args.only)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            args.output.write_text(output, encoding="utf-8")
+        else:
+            print(output)
+        for gap in report["missing"]:
+            print(f"No fixture for {gap['selector_file']} ({gap['fixture']}), skipped", file=sys.stderr)
+        if not report["results"]:
+            print(f"Nothing was benchmarked, no fixture pages in {args.fixtures}", file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == "compare":
+        before = json.loads(args.before.read_text(encoding="utf-8"))
+        after = json.loads(args.after.read_text(encoding="utf-8"))
+        lines, regressions = compare(before, after, args.threshold)
+        print("\n".join(lines))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+
+    if args.command == "check":
+        problems = check(args.fixtures, args.backend or list(BACKENDS))
+        print("\n".join(problems) if problems else "All fixtures extract like their snapshots")
+        return 1 if problems else 0
+
+    if args.command == "snapshot":
+        written = snapshot(args.fixtures)
+        for name in written:
+            print(f"Snapshot saved for {name}", file=sys.stderr)
+        if not written:
+            print(f"No fixture pages in {args.fixtures}", file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == "record":
+        ids = {"profile": args.character, "freecompany": args.freecompany, "pvpteam": args.pvpteam}
+        asyncio.run(record(args.fixtures, args.region, ids, args.search))
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
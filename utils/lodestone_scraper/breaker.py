@@ -0,0 +1,155 @@
+"""
+Per-host circuit breaker for Lodestone requests.
+When a region host stops answering (a run of timeouts or 5xx) or says it's under maintenance, the circuit opens and
+every scrape to that host fails straight away with LodestoneUnavailable instead of sitting out the full timeout.
+Once the open period is up the next request goes out as a probe (half-open): if it works the circuit closes again,
+if not it stays open for twice as long. Maintenance is told apart from a blip by the response alone, a 503 whose
+Retry-After is longer than any throttle would be, no guessing at the markup of the page that comes with it.
+"""
+
+import logging
+import time
+
+from .errors import LodestoneUnavailable
+from .ratelimit import parse_retry_after
+
+logger = logging.getLogger("bot")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+FAILURE_THRESHOLD = 5    # consecutive timeouts / 5xx before the circuit opens
+OPEN_BASE = 30.0         # seconds open after a trip, doubled after each failed probe
+OPEN_CAP = 300.0         # seconds, never longer than this between probes
+MAINTENANCE_OPEN = 300.0 # seconds, most we stay away during maintenance before probing, in case it ends early
+MAINTENANCE_RETRY_AFTER = 60.0  # seconds, a 503 asking us to wait at least this long is downtime, not throttling
+PROBE_POLL = 5.0         # seconds to come back after when someone else's probe is still out
+
+
+class CircuitBreaker:
+    """
+    One host's circuit. Failures only count while closed, a half-open circuit lets exactly one probe through.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = CLOSED
+        self.failures = 0            # consecutive, reset by any answer that isn't a 5xx
+        self.reason = None           # why it opened, shown to admins
+        self.maintenance = False
+        self.open_until = 0.0        # monotonic
+        self.open_period = OPEN_BASE
+        self.trips = 0
+        self._probing = False
+
+    def retry_in(self) -> float:
+        """
+        Seconds until a request to this host is worth trying, 0 if it is right now.
+        """
+        if self.state == CLOSED:
+            return 0.0
+        if self.state == OPEN:
+            return max(self.open_until - time.monotonic(), 0.0)
+        return PROBE_POLL if self._probing else 0.0
+
+    def check(self):
+        """
+        Raises LodestoneUnavailable if there's no point sending anything to this host right now.
+        """
+        if self.state == OPEN and time.monotonic() >= self.open_until:
+            return  # due a probe, allow() hands it out
+        if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+            raise self.unavailable()
+
+    def allow(self) -> bool:
+        """
+        Call right before a request goes out. Raises LodestoneUnavailable while open,
+        returns True if this request is the half-open probe (report back with succeeded/failed, or release_probe).
+        """
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN and time.monotonic() >= self.open_until:
+            self.state = HALF_OPEN
+            logger.info("Lodestone circuit for %s half-open, probing", self.host)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        raise self.unavailable()
+
+    def succeeded(self):
+        # Any answer that isn't a 5xx means the host is up
+        if self.state != CLOSED:
+            logger.info("Lodestone circuit for %s closed, %s is back", self.host, self.host)
+        self.state = CLOSED
+        self.failures = 0
+        self.reason = None
+        self.maintenance = False
+        self.open_period = OPEN_BASE
+        self._probing = False
+
+    def failed(self, reason: str):
+        if self.state == HALF_OPEN:
+            # Probe didn't make it, stay away for longer this time
+            self._open(reason, min(self.open_period * 2, OPEN_CAP), self.maintenance)
+            return
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= FAILURE_THRESHOLD:
+            self._open(reason, self.open_period)
+
+    def under_maintenance(self, retry_after: float):
+        # No need to wait for a run of failures, Lodestone told us
+        self._open(f"maintenance, back in ~{retry_after / 60:.0f} min", min(retry_after, MAINTENANCE_OPEN), maintenance=True)
+
+    def release_probe(self):
+        # The probe ended without telling us anything (cancelled, say), let the next request have a go
+        self._probing = False
+
+    def _open(self, reason: str, period: float, maintenance: bool = False):
+        if self.state != OPEN:
+            self.trips += 1
+            logger.warning("Lodestone circuit for %s open for %.0fs: %s", self.host, period, reason)
+        self.state = OPEN
+        self.reason = reason
+        self.maintenance = maintenance
+        self.open_period = period
+        self.open_until = time.monotonic() + period
+        self._probing = False
+
+    def unavailable(self) -> LodestoneUnavailable:
+        return LodestoneUnavailable(self.host, self.reason, self.retry_in(), self.maintenance)
+
+
+_breakers = {}
+
+def breaker_for(host: str) -> CircuitBreaker:
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+def snapshot() -> dict:
+    """
+    Current state of every host's circuit, for the admin commands.
+    """
+    return {
+        host: {
+            "state": breaker.state,
+            "reason": breaker.reason,
+            "retry_in": round(breaker.retry_in(), 1),
+            "failures": breaker.failures,
+            "trips": breaker.trips,
+        }
+        for host, breaker in sorted(_breakers.items())
+    }
+
+def maintenance_retry_after(status: int, retry_after: str | None) -> float | None:
+    """
+    How long Lodestone says it's down for, None if this response isn't maintenance.
+    """
+    if status != 503:
+        return None
+    seconds = parse_retry_after(retry_after)
+    if seconds is None or seconds < MAINTENANCE_RETRY_AFTER:
+        return None  # a plain 503, or one that's only asking us to slow down
+    return seconds
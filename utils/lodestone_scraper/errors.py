@@ -0,0 +1,50 @@
+"""
+Exceptions raised by the Lodestone scraper.
+They live in their own module so selectors.py, extract.py and scraper.py can all raise them without importing each other.
+"""
+
+class SelectorNotFound(Exception):
+    pass
+
+class URIBuilderError(Exception):
+    pass
+
+class LodestoneHTTPError(Exception):
+    """
+    Lodestone answered with something other than a page, `status` has the HTTP status code.
+    """
+    def __init__(self, status: int, url: str | None = None):
+        super().__init__(f"HTTP {status}: Failed to fetch page.")
+        self.status = status
+        self.url = url
+
+class RateLimitDeadlineExceeded(Exception):
+    """
+    Our turn in the rate limiter queue (or Lodestone's Retry-After) is further off than the caller was willing to wait.
+    """
+    def __init__(self, wait: float, max_wait: float):
+        super().__init__(f"Rate limited: would have to wait {wait:.1f}s, deadline allows {max_wait:.1f}s.")
+        self.wait = wait
+        self.max_wait = max_wait
+
+class LodestoneBodyTooLarge(Exception):
+    """
+    The page was bigger than we're willing to read, something is very wrong on Lodestone's end (or it isn't Lodestone).
+    """
+    def __init__(self, size: int, limit: int, url: str | None = None):
+        super().__init__(f"Response body over {limit} bytes ({size} read), gave up.")
+        self.size = size
+        self.limit = limit
+        self.url = url
+
+class LodestoneUnavailable(Exception):
+    """
+    The circuit breaker for this host is open (maintenance or an outage), so we didn't even try.
+    `maintenance` is True when Lodestone said so itself, `retry_in` is roughly how many seconds until it's tried again.
+    """
+    def __init__(self, host: str, reason: str | None, retry_in: float, maintenance: bool = False):
+        super().__init__(f"Lodestone ({host}) is unavailable: {reason or 'not responding'}, retrying in {retry_in:.0f}s.")
+        self.host = host
+        self.reason = reason
+        self.retry_in = retry_in
+        self.maintenance = maintenance
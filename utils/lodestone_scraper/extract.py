@@ -1,72 +1,198 @@
-import re
+from .selectors import FieldSelector, FieldOpsSelector, GroupSelector, compile_selector
+from .backends import as_document
 
-def extract_element(soup, selector_dict):
+def extract_element(doc, selector):
     """
-    Recursively extract data from soup using selector_dict rules.
-    Supports generic selectors and field ops custom logic.
+    Recursively extract data from a parsed page using selector rules.
+    `doc` is a backends.Document (a bare BeautifulSoup/selectolax tree is wrapped for you).
+    Takes a compiled selector from the registry, or a raw selector dict which gets compiled on the spot.
+    Supports generic selectors, ROOT/ENTRY lists and field ops custom logic.
     """
-    # Field Ops Special Case (header-based and none of that nth child nonsense)
-    if selector_dict.get("_field_ops_header"):
-        return extract_nonstatic_detail(
-            soup,
-            selector_dict["_field_ops_header"],
-            selector_dict.get("_data_index", 0)
-        )
-    
-    # Normal Extraction
-    if "selector" in selector_dict:
-        css_selector = selector_dict["selector"]
-        elements = soup.select(css_selector)
+    doc = as_document(doc)
+    if isinstance(selector, dict):
+        selector = compile_selector(selector)
+    return _extract(doc, doc.tree, selector)
+
+def iter_records(doc, selector):
+    """
+    Yields one record per ROOT match of a list block (e.g. ENTRY in freecompany/members.json), lazily.
+    Each record maps the ROOT's sibling keys to values found inside that one ROOT element, so NAME/ID/FC_RANK line up.
+    """
+    doc = as_document(doc)
+    if isinstance(selector, dict):
+        selector = compile_selector(selector)
+    if getattr(selector, "entry_root", None) is None:
+        raise ValueError("iter_records needs a block with a ROOT selector marked multiple: true")
+    return _records(doc, doc.tree, selector)
 
-        if not elements:
-            return [] if selector_dict.get("multiple") else None
+def _extract(doc, scope, selector):
+    """
+    Extracts `selector` looking only inside `scope` (the whole page, or one list entry).
+    """
+    # Field Ops Special Case (header-based and none of that nth child nonsense)
+    if isinstance(selector, FieldOpsSelector):
+        return extract_nonstatic_detail(doc, selector.header, selector.data_index)
 
+    # Normal Extraction
+    if isinstance(selector, FieldSelector):
+        backend = doc.backend
         # Multiple
-        if selector_dict.get("multiple"):
-            results = []
-            for el in elements:
-                val = _extract_from_element(el, selector_dict)
-                if "regex" in selector_dict and val is not None:
-                    match = re.search(selector_dict["regex"], val)
-                    results.append(match.groupdict() if match else None)
-                else:
-                    results.append(val)
-            return results
+        if selector.multiple:
+            return _field_value(backend, backend.select(scope, selector), selector)
 
         # Single value
-        val = _extract_from_element(elements[0], selector_dict)
-        if "regex" in selector_dict and val is not None:
-            match = re.search(selector_dict["regex"], val)
-            return match.groupdict() if match else None
-        return val
+        element = backend.select_one(scope, selector)
+        return _field_value(backend, [] if element is None else [element], selector)
+
+    # List of entries, every field evaluated inside its own ROOT element
+    if selector.entry_root is not None:
+        return list(_records(doc, scope, selector))
+
+    # A block run against the whole page walks the shared-prefix trie once instead of every selector from the top
+    if scope is doc.tree:
+        return _assemble(doc, scope, selector, _walk_trie(doc, selector.trie))
 
     # Nested dict helper, recursive innit (FC crest layers etc)
     result = {}
-    for key, subdict in selector_dict.items():
-        result[key] = extract_element(soup, subdict)
+    for key, sub in selector.children.items():
+        result[key] = _extract(doc, scope, sub)
     return result
 
-def _extract_from_element(element, selector_dict):
+def _assemble(doc, scope, group, values):
     """
-    Helper: extracts attribute or text from a single BeautifulSoup element.
+    Puts a block's dict back together from the values the trie walk found, lists and field ops are extracted as usual.
     """
-    if "attribute" in selector_dict:
-        return element.get(selector_dict["attribute"])
-    return element.get_text(strip=True)
+    result = {}
+    for key, sub in group.children.items():
+        if isinstance(sub, FieldSelector):
+            result[key] = values[sub]
+        elif isinstance(sub, GroupSelector) and sub.entry_root is None:
+            result[key] = _assemble(doc, scope, sub, values)
+        else:
+            result[key] = _extract(doc, scope, sub)
+    return result
 
-def extract_nonstatic_detail(soup, header_name: str, data_index: int):
+def _walk_trie(doc, trie):
+    """
+    Evaluates every field in the trie, returns {FieldSelector: value}.
+    """
+    backend = doc.backend
+    values = {}
+    for field in trie.loose:
+        values[field] = _extract(doc, doc.tree, field)
+    for node in trie.roots.values():
+        found = backend.select(doc.tree, node.step)
+        if len(found) > 1:
+            # First step matched in several places, which could be nested in each other and mess up document order,
+            # so let each field under it look for itself
+            for field in node.all_fields():
+                values[field] = _extract(doc, doc.tree, field)
+            continue
+        _descend(backend, node, found, values)
+    return values
+
+def _descend(backend, node, elements, values):
+    for field in node.fields:
+        values[field] = _field_value(backend, elements, field)
+    if not node.children:
+        return
+    kids = [backend.children(el) for el in elements]
+    for child in node.children.values():
+        step = child.step
+        matched = []
+        for siblings in kids:
+            # nth-child/nth-of-type means there's only one element to look at
+            if step.nth is not None:
+                candidate = siblings[step.nth - 1] if step.nth <= len(siblings) else None
+            elif step.nth_of_type is not None:
+                same_tag = [el for el in siblings if backend.tag(el) == step.tag]
+                candidate = same_tag[step.nth_of_type - 1] if step.nth_of_type <= len(same_tag) else None
+            else:
+                matched.extend(el for el in siblings if _step_matches(backend, step, el))
+                continue
+            if candidate is not None and _step_matches(backend, step, candidate):
+                matched.append(candidate)
+        _descend(backend, child, matched, values)
+
+def _step_matches(backend, step, element) -> bool:
+    if step.tag is not None and backend.tag(element) != step.tag:
+        return False
+    if step.id is not None and backend.attribute(element, "id") != step.id:
+        return False
+    if step.classes:
+        classes = (backend.attribute(element, "class") or "").split()
+        if not all(cls in classes for cls in step.classes):
+            return False
+    return True
+
+def _records(doc, scope, selector):
+    for root in doc.backend.select(scope, selector.entry_root):
+        yield {key: _extract(doc, root, sub) for key, sub in selector.fields.items()}
+
+def _field_value(backend, elements, selector: FieldSelector):
+    """
+    Helper: turns the elements a field matched into its value, a list for multiple fields, first match (or None) otherwise.
+    """
+    if not selector.multiple:
+        elements = elements[:1]
+    results = []
+    for el in elements:
+        val = _extract_from_element(backend, el, selector)
+        if selector.regex is not None and val is not None:
+            match = selector.regex.search(val)
+            val = match.groupdict() if match else None
+        results.append(val)
+    if selector.multiple:
+        return results
+    return results[0] if results else None
+
+def _extract_from_element(backend, element, selector: FieldSelector):
+    """
+    Helper: extracts attribute or text from a single element, whichever backend parsed it.
+    """
+    if selector.attribute is not None:
+        return backend.attribute(element, selector.attribute)
+    return backend.text(element)
+
+def extract_nonstatic_detail(doc, header_name: str, data_index: int):
     """
     Finds a field ops section by heading text and returns the Nth div's text from its data block.
     - header_name: e.g. "Bozjan Southern Front", "The Forbidden Land, Eureka", "Occult Crescent"
     - data_index: 0 for Level, 1 for Current, 2 for To Next, etc (per block structure)
+    The page's headings are only read once, every later lookup on the same document hits the index.
+    """
+    doc = as_document(doc)
+    if doc.headings is None:
+        doc.headings = HeadingIndex(doc.backend.heading_blocks(doc.tree))
+    values = doc.headings.find(header_name)
+    if values is None:
+        return None  # Not found
+    if 0 <= data_index < len(values):
+        return values[data_index]
+    return None  # Index out of range
+
+class HeadingIndex:
+    """
+    Field ops headings of one page, normalised text -> that heading's data block values.
+    Lookups match on a substring of the heading like they always have, and the answer (misses too) is remembered.
     """
-    for heading in soup.select("h3.heading-md"):
-        if header_name.lower() in heading.get_text(strip=True).lower():
-            block = heading.find_next_sibling("div", class_="character__job__list")
-            if block:
-                values = [div.get_text(strip=True) for div in block.find_all("div", recursive=False)]
-                if 0 <= data_index < len(values):
-                    return values[data_index]
-                else:
-                    return None  # Index out of range
-    return None  # Not found
+    __slots__ = ("_blocks", "_lookups")
+
+    def __init__(self, blocks):
+        self._blocks = []
+        self._lookups = {}
+        for heading_text, values in blocks:
+            if values is None:
+                continue  # a heading without a data block can't answer anything
+            text = _normalise_heading(heading_text)
+            self._blocks.append((text, values))
+            self._lookups.setdefault(text, values)
+
+    def find(self, header_name: str):
+        key = _normalise_heading(header_name)
+        if key not in self._lookups:
+            self._lookups[key] = next((values for text, values in self._blocks if key in text), None)
+        return self._lookups[key]
+
+def _normalise_heading(text: str) -> str:
+    return " ".join(text.lower().split())
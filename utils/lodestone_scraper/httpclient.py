@@ -0,0 +1,55 @@
+import aiohttp
+
+from . import metrics
+
+# One pooled session for all Lodestone traffic, lives as long as the bot does (see main.run)
+_session = None
+
+# Defaults, override any of them through connect()
+DEFAULT_LIMIT = 32            # total open connections
+DEFAULT_LIMIT_PER_HOST = 8    # per region host (na., eu., ...)
+DEFAULT_DNS_TTL = 300         # seconds to cache DNS lookups
+DEFAULT_KEEPALIVE = 30        # seconds an idle connection is kept for reuse
+DEFAULT_TOTAL_TIMEOUT = 15    # seconds for a whole request
+DEFAULT_CONNECT_TIMEOUT = 5   # seconds to get a connection (pool wait + TCP + TLS)
+
+###################
+### The Basics™ ###
+###################
+
+# Open the shared session with keep-alive pooling and DNS caching
+async def connect(
+    limit: int = DEFAULT_LIMIT,
+    limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+    dns_ttl: int = DEFAULT_DNS_TTL,
+    keepalive_timeout: float = DEFAULT_KEEPALIVE,
+    total_timeout: float = DEFAULT_TOTAL_TIMEOUT,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+):
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_ttl,
+            keepalive_timeout=keepalive_timeout,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout),
+            trace_configs=[metrics.trace_config()],  # connect timings for ~scrapemetrics
+        )
+
+# Close the shared session and every pooled connection
+async def close():
+    global _session
+    if _session:
+        await _session.close()
+        _session = None
+
+# The shared session, or None if connect() hasn't been called (scripts, one-off tools)
+def get_session():
+    if _session is None or _session.closed:
+        return None
+    return _session
@@ -0,0 +1,180 @@
+"""
+Load driver for the scraper, meant to be pointed at the stand-in server in standin.py (never at the real Lodestone).
+Runs N concurrent scrape() or verification flows through the pooled session, rate limiter and (optionally) the page cache,
+then reports throughput, latency percentiles and what went wrong.
+
+    python -m utils.lodestone_scraper.standin --latency 80 --jitter 40 --rate-429 0.02 &
+    python -m utils.lodestone_scraper.loadtest --base-url http://127.0.0.1:8080 --concurrency 50 --requests 2000 --flow verify
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from . import httpclient, ratelimit
+from .scraper import LodestoneScraper
+
+VERIFY_SELECTORS = ["profile.character.BIO", "profile.character.NAME", "profile.character.SERVER"]
+
+
+def _flow(scraper: LodestoneScraper, flow: str, selector: str, max_wait: float | None):
+    # Returns the coroutine function for one operation against one lodestone ID
+    async def scrape(lodestone_id):
+        await scraper.scrape(selector, lodestone_id, max_wait=max_wait)
+
+    async def verify(lodestone_id):
+        # Same reads as verification.fetch_bio_and_profile, without needing discord around
+        await scraper.scrape_many(VERIFY_SELECTORS, lodestone_id, bypass_cache=True, stream=True, max_wait=max_wait)
+
+    if flow == "scrape":
+        return scrape
+    if flow == "verify":
+        return verify
+
+    async def mixed(lodestone_id):
+        await (verify if lodestone_id % 10 == 0 else scrape)(lodestone_id)
+    return mixed
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {
+        "mean": round(statistics.fmean(ordered) * 1000, 2),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+async def drive(args) -> dict:
+    """
+    Runs the load test described by the parsed CLI args, returns the report.
+    """
+    await httpclient.connect(limit=args.pool, limit_per_host=args.pool)
+
+    # The stand-in is one host, so one bucket decides how hard we push. Give it room unless we're testing the limiter.
+    bucket = ratelimit.bucket_for(urlsplit(args.base_url).hostname)
+    if args.rate is not None:
+        bucket.rate = args.rate
+        ratelimit.MAX_RATE = max(ratelimit.MAX_RATE, args.rate)
+    if args.burst is not None:
+        bucket.burst = args.burst
+
+    scraper = LodestoneScraper(
+        base_url=args.base_url,
+        parser=args.parser,
+        cache=args.cache,
+        coalesce=not args.no_coalesce,
+        timeout=args.timeout,
+    )
+    operation = _flow(scraper, args.flow, args.selector, args.max_wait)
+
+    latencies, errors = [], Counter()
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        while args.duration is not None or issued < args.requests:
+            lodestone_id = args.first_id + issued % args.ids
+            issued += 1
+            started = time.perf_counter()
+            try:
+                await operation(lodestone_id)
+            except Exception as exc:
+                errors[type(exc).__name__] += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    workers = [asyncio.ensure_future(worker()) for _ in range(args.concurrency)]
+    try:
+        # With --duration whatever is still running (queued behind the rate limiter, mid retry...) when time's up is cut off
+        done, unfinished = await asyncio.wait(workers, timeout=args.duration)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for task in done:
+            task.result()
+    finally:
+        elapsed = time.perf_counter() - started
+        await httpclient.close()
+
+    return {
+        "flow": args.flow,
+        "concurrency": args.concurrency,
+        "operations": issued,
+        "succeeded": len(latencies),
+        "cut_off": len(unfinished),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": _percentiles(latencies),
+        "rate_limits": ratelimit.snapshot(),
+        "server": await _server_stats(args.base_url),
+    }
+
+async def _server_stats(base_url: str):
+    # The stand-in's own counters, None if whatever we hit isn't the stand-in
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url.rstrip('/')}/_standin/stats") as resp:
+                return await resp.json() if resp.status == 200 else None
+    except (aiohttp.ClientError, ValueError):
+        return None
+
+def _print_report(report: dict):
+    latency = report["latency_ms"]
+    print(f"{report['flow']} x{report['concurrency']}: {report['succeeded']}/{report['operations']} ok in {report['elapsed_s']}s, "
+          f"{report['throughput_ops_s']} ops/s, {report['cut_off']} cut off at the end")
+    if latency:
+        print("latency ms  " + "  ".join(f"{key} {value}" for key, value in latency.items()))
+    for name, count in sorted(report["errors"].items()):
+        print(f"error {name}: {count}")
+    for host, bucket in report["rate_limits"].items():
+        print(f"bucket {host}: {bucket}")
+    if report["server"]:
+        print("server " + ", ".join(f"{key}: {value}" for key, value in sorted(report["server"].items())))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.lodestone_scraper.loadtest", description="Scraper load driver")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080", help="stand-in server to hit")
+    parser.add_argument("--flow", choices=["scrape", "verify", "mixed"], default="scrape")
+    parser.add_argument("--selector", default="profile.character", help="selector string for the scrape flow")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="total operations (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead")
+    parser.add_argument("--ids", type=int, default=1000, help="how many distinct lodestone IDs to cycle through")
+    parser.add_argument("--first-id", type=int, default=1)
+    parser.add_argument("--parser", choices=["bs4", "selectolax"])
+    parser.add_argument("--cache", action="store_true", help="use the Redis page cache (needs Redis configured)")
+    parser.add_argument("--no-coalesce", action="store_true", help="turn single-flight coalescing off")
+    parser.add_argument("--pool", type=int, default=httpclient.DEFAULT_LIMIT, help="connection pool size")
+    parser.add_argument("--rate", type=float, help="requests/s for the host's rate limiter bucket")
+    parser.add_argument("--burst", type=int, help="burst size for the host's rate limiter bucket")
+    parser.add_argument("--timeout", type=float, default=15)
+    parser.add_argument("--max-wait", type=float, help="give up on an operation queued/backing off longer than this (seconds)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(drive(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+    return 0 if report["succeeded"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
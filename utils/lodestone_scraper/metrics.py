@@ -0,0 +1,180 @@
+"""
+Where scrape time goes.
+The scraper times every stage of a page load (rate limiter queue, connect, time to first byte, body download, parse,
+extract) and counts bytes, cache hits/misses, retries and status codes, all labelled by region and the selector file
+(category/filename) the page was loaded for. Everything lives in memory in fixed-bucket histograms and counters,
+cheap enough to leave on all the time, and ~scrapemetrics reads it back.
+
+    metrics.observe("ttfb", ("eu", "profile/character"), 0.231)
+    metrics.count("status_200", ("eu", "profile/character"))
+"""
+
+import bisect
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import aiohttp
+
+STAGES = ("queue", "connect", "ttfb", "body", "pool_wait", "parse", "extract", "total")
+
+# Bucket upper bounds in seconds, roughly x2-x2.5 apart, anything slower lands in the last (infinite) bucket
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, float("inf"))
+
+_histograms = {}  # (stage, region, file) -> Histogram
+_counters = Counter()  # (name, region, file) -> count
+_since = time.time()
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Quantiles are read off the buckets, so they're an upper bound, not exact.
+    """
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)  # the infinite bucket (or a sparse one) reads better as the real max
+        return self.max
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+###################
+### The Basics™ ###
+###################
+
+def label(region: str, plan) -> tuple:
+    # (region, "category/filename"), what every metric is filed under
+    return (region, f"{plan.category}/{plan.filename}")
+
+def observe(stage: str, labels: tuple, seconds: float):
+    histogram = _histograms.get((stage, *labels))
+    if histogram is None:
+        histogram = _histograms[(stage, *labels)] = Histogram()
+    histogram.observe(seconds)
+
+def count(name: str, labels: tuple, amount: int = 1):
+    _counters[(name, *labels)] += amount
+
+@contextmanager
+def timer(stage: str, labels: tuple):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, labels, time.perf_counter() - start)
+
+def reset():
+    global _since
+    _histograms.clear()
+    _counters.clear()
+    _since = time.time()
+
+def since() -> float:
+    # Unix time the numbers start from (startup or the last reset)
+    return _since
+
+def snapshot(match: str | None = None) -> dict:
+    """
+    Everything recorded so far, {(region, file): {"stages": {stage: Histogram}, "counters": {name: count}}}.
+    match keeps only labels whose region or file contains it ("eu", "profile/", "freecompany/members").
+    """
+    result = {}
+    for (stage, *labels), histogram in _histograms.items():
+        if _matches(labels, match):
+            result.setdefault(tuple(labels), {"stages": {}, "counters": {}})["stages"][stage] = histogram
+    for (name, *labels), value in _counters.items():
+        if _matches(labels, match):
+            result.setdefault(tuple(labels), {"stages": {}, "counters": {}})["counters"][name] = value
+    return result
+
+def totals(match: str | None = None) -> dict:
+    """
+    Same as snapshot() but added up across every label, {"stages": {stage: Histogram}, "counters": {name: count}}.
+    """
+    stages, counters = {}, Counter()
+    for entry in snapshot(match).values():
+        for stage, histogram in entry["stages"].items():
+            stages.setdefault(stage, Histogram()).merge(histogram)
+        counters.update(entry["counters"])
+    return {"stages": stages, "counters": dict(counters)}
+
+def _matches(labels, match) -> bool:
+    return match is None or any(match in value for value in labels)
+
+########################
+### Connection Trace ###
+########################
+
+def trace_config() -> aiohttp.TraceConfig:
+    """
+    aiohttp trace hooks that time getting a connection (pool queue + TCP + TLS) for requests made with
+    trace_request_ctx=ConnectTiming(). Sessions without it just report no connect time.
+    """
+    config = aiohttp.TraceConfig()
+    config.on_connection_queued_start.append(_connect_started)
+    config.on_connection_create_start.append(_connect_started)
+    config.on_connection_queued_end.append(_connect_ended)
+    config.on_connection_create_end.append(_connect_ended)
+    config.on_connection_reuseconn.append(_connection_reused)
+    return config
+
+
+class ConnectTiming:
+    """
+    Per-request scratchpad the trace hooks write into.
+    """
+    __slots__ = ("seconds", "reused", "_started")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.reused = False
+        self._started = None
+
+
+async def _connect_started(session, context, params):
+    timing = context.trace_request_ctx
+    if isinstance(timing, ConnectTiming) and timing._started is None:
+        timing._started = time.perf_counter()
+
+async def _connect_ended(session, context, params):
+    timing = context.trace_request_ctx
+    if isinstance(timing, ConnectTiming) and timing._started is not None:
+        timing.seconds += time.perf_counter() - timing._started
+        timing._started = None
+
+async def _connection_reused(session, context, params):
+    timing = context.trace_request_ctx
+    if isinstance(timing, ConnectTiming):
+        timing.reused = True
@@ -0,0 +1,120 @@
+"""
+Redis-backed cache for raw Lodestone pages, sat in front of the HTTP fetch in LodestoneScraper.
+Pages are keyed by their resolved URL and stored zlib-compressed in the shared Redis pool.
+How long a page counts as fresh depends on which selector file is asking, so a BIO check can insist on a recent copy of a page
+that a gearset read would happily take from an hour ago. Stale pages stay around for a while so we can revalidate them with ETag/Last-Modified.
+"""
+
+import base64
+import logging
+import time
+import zlib
+
+logger = logging.getLogger("bot")
+
+# Seconds a cached page counts as fresh, per selector file
+CACHE_TTLS = {
+    "freecompany/focus.json": 6 * 3600,
+    "freecompany/freecompany.json": 3600,
+    "freecompany/members.json": 900,
+    "freecompany/reputation.json": 6 * 3600,
+    "freecompany/seeking.json": 6 * 3600,
+
+    "profile/achievements.json": 900,
+    "profile/attributes.json": 900,
+    "profile/character.json": 60,  # BIO checks live here, keep it short so a freshly saved token shows up
+    "profile/classjob.json": 900,
+    "profile/gearset.json": 900,
+    "profile/minion.json": 3600,
+    "profile/mount.json": 3600,
+
+    "pvpteam/members.json": 6 * 3600,
+    "pvpteam/pvpteam.json": 6 * 3600,
+
+    "search/character.json": 300,
+    "search/freecompany.json": 300,
+    "search/pvpteam.json": 300,
+}
+DEFAULT_TTL = 300
+
+# How long a page is kept after it goes stale, so it can still be revalidated instead of refetched
+KEEP_STALE_FOR = 24 * 3600
+
+
+class CachedPage:
+    __slots__ = ("body", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, body: str, etag: str | None, last_modified: str | None, fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl: int) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def revalidation_headers(self) -> dict:
+        """
+        Conditional request headers for this page, empty if the server never gave us a validator.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def ttl_for(uri_key: str) -> int:
+    return CACHE_TTLS.get(uri_key, DEFAULT_TTL)
+
+async def lookup(url: str) -> CachedPage | None:
+    """
+    Returns whatever we have cached for this URL, fresh or not (check with is_fresh), or None.
+    Redis trouble is logged and treated as a miss, the cache should never break a scrape.
+    """
+    try:
+        from utils.database import redis
+        page = await redis.get_lodestone_page(url)
+    except Exception:
+        logger.warning("Lodestone page cache lookup failed for %s", url, exc_info=True)
+        return None
+    if not page or "body" not in page:
+        return None
+    try:
+        body = zlib.decompress(base64.b64decode(page["body"])).decode("utf-8")
+    except (ValueError, zlib.error):
+        logger.warning("Dropping corrupt Lodestone page cache entry for %s", url)
+        return None
+    return CachedPage(
+        body,
+        page.get("etag") or None,
+        page.get("last_modified") or None,
+        float(page.get("fetched_at", 0)),
+    )
+
+async def store(url: str, body: str, etag: str | None = None, last_modified: str | None = None):
+    """
+    Caches a freshly downloaded page body along with its validators.
+    """
+    page = {
+        "body": base64.b64encode(zlib.compress(body.encode("utf-8"))).decode("ascii"),
+        "etag": etag or "",
+        "last_modified": last_modified or "",
+        "fetched_at": repr(time.time()),
+    }
+    try:
+        from utils.database import redis
+        await redis.set_lodestone_page(url, page, KEEP_STALE_FOR)
+    except Exception:
+        logger.warning("Lodestone page cache store failed for %s", url, exc_info=True)
+
+async def mark_revalidated(url: str):
+    """
+    The server said 304 Not Modified, so the copy we have is fresh again.
+    """
+    try:
+        from utils.database import redis
+        await redis.set_lodestone_page(url, {"fetched_at": repr(time.time())}, KEEP_STALE_FOR)
+    except Exception:
+        logger.warning("Lodestone page cache refresh failed for %s", url, exc_info=True)
@@ -0,0 +1,116 @@
+"""
+Worker pool for parsing and extracting Lodestone pages away from the event loop.
+A big character page run through gearset.json can hold the loop for long enough to stall the gateway heartbeat,
+so when the pool is running the scraper hands the raw HTML and the selectors it wants over here and gets plain dicts back.
+Workers keep their own warm selector registry, so only (category, file, keys) references cross the process boundary.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .backends import get_backend
+from .extract import extract_element
+from .selectors import registry
+
+logger = logging.getLogger("bot")
+
+_executor = None
+_inline_below = 0
+
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+DEFAULT_INLINE_BELOW = 32 * 1024  # characters, anything smaller isn't worth the round trip to a worker
+
+###################
+### The Basics™ ###
+###################
+
+# Start the pool and wait for every worker to be up with its registry loaded
+async def start(workers: int = DEFAULT_WORKERS, kind: str = "process", inline_below: int = DEFAULT_INLINE_BELOW):
+    global _executor, _inline_below
+    if _executor is not None:
+        return
+    if kind == "process":
+        # spawn rather than fork, forking a process with a running event loop and open sockets is asking for trouble
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+    elif kind == "thread":
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lodestone-parse", initializer=_warm_worker)
+    else:
+        raise ValueError(f"Unknown parse pool kind '{kind}', use 'process' or 'thread'")
+    _inline_below = inline_below
+
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(_executor, _ping) for _ in range(workers)))
+    except BaseException:
+        # Half a pool is no pool, fall back to parsing inline
+        executor, _executor = _executor, None
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+# Shut the workers down
+async def close():
+    global _executor
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+def running() -> bool:
+    return _executor is not None
+
+async def extract(html: str, backend_name: str, refs: list, timings: dict | None = None) -> list:
+    """
+    Parses html with the named backend and extracts every (category, filename, keys) in refs from it.
+    Returns the raw extract_element() values in the same order as refs.
+    Runs on a worker if the pool is up and the page is big enough, otherwise right here.
+    Pass a timings dict to get seconds spent on "parse", "extract" and (on a worker) "pool_wait" written into it.
+    """
+    if _executor is None or len(html) < _inline_below:
+        results, parse, extracted = timed_extract_job(html, backend_name, refs)
+    else:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        results, parse, extracted = await loop.run_in_executor(_executor, timed_extract_job, html, backend_name, refs)
+        if timings is not None:
+            # Queueing for a worker plus shipping the page over and the results back
+            timings["pool_wait"] = max(time.perf_counter() - started - parse - extracted, 0.0)
+    if timings is not None:
+        timings["parse"] = parse
+        timings["extract"] = extracted
+    return results
+
+###############
+### Workers ###
+###############
+
+def extract_job(html: str, backend_name: str, refs: list) -> list:
+    """
+    The actual work, also usable inline. Everything in and out is plain data so it pickles cheaply.
+    """
+    return timed_extract_job(html, backend_name, refs)[0]
+
+def timed_extract_job(html: str, backend_name: str, refs: list) -> tuple:
+    """
+    extract_job, also returning how long parsing and extraction took: (results, parse seconds, extract seconds).
+    """
+    started = time.perf_counter()
+    doc = get_backend(backend_name).parse(html)
+    parsed = time.perf_counter()
+    results = []
+    for category, filename, keys in refs:
+        target = registry.get(category, filename).resolve(keys)
+        results.append(extract_element(doc, target))
+    return results, parsed - started, time.perf_counter() - parsed
+
+def _warm_worker():
+    registry.preload(strict=False)
+
+def _ping():
+    return os.getpid()
@@ -0,0 +1,129 @@
+"""
+Per-host rate limiting for Lodestone requests.
+Every region host (na., eu., ...) gets its own token bucket. The bucket slows down when Lodestone pushes back (429/503)
+and creeps back up while requests keep succeeding, so bulk refreshes settle at the fastest rate Lodestone will put up with.
+"""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from .errors import RateLimitDeadlineExceeded
+
+# Defaults per host
+DEFAULT_RATE = 2.0       # requests per second to start at
+MIN_RATE = 0.25          # never slow down past this
+MAX_RATE = 5.0           # never speed up past this
+DEFAULT_BURST = 5        # requests allowed back to back before the rate applies
+RATE_STEP_UP = 0.05      # added to the rate after each success
+RATE_BACKOFF = 0.5       # rate multiplier after a 429/503
+
+# Retry backoff
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0       # seconds, doubled each attempt
+BACKOFF_CAP = 30.0       # seconds
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A token bucket done as virtual scheduling: each caller reserves the next free slot, so the queue is FIFO
+    and we know how long someone will wait before they start waiting.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._next_slot = 0.0        # when the queue so far will have drained, in monotonic time
+        self.blocked_until = 0.0     # set from Retry-After, nothing goes out before this
+
+    def _slot_for(self, now: float) -> float:
+        # Earliest moment the next request may go out
+        start = max(self._next_slot, now, self.blocked_until)
+        return max(start - (self.burst - 1) / self.rate, now, self.blocked_until)
+
+    def wait_time(self) -> float:
+        """
+        How long a request queued right now would wait.
+        """
+        now = time.monotonic()
+        return self._slot_for(now) - now
+
+    def tokens(self) -> float:
+        """
+        Tokens currently available (can go negative when there's a queue).
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return 0.0
+        backlog = max(self._next_slot - now, 0.0) * self.rate
+        return min(self.burst - backlog, float(self.burst))
+
+    async def acquire(self, max_wait: float | None = None):
+        """
+        Waits for our turn. Raises RateLimitDeadlineExceeded straight away, without taking a slot,
+        if that turn is further off than max_wait seconds.
+        """
+        now = time.monotonic()
+        slot = self._slot_for(now)
+        wait = slot - now
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitDeadlineExceeded(wait, max_wait)
+        self._next_slot = max(self._next_slot, now, self.blocked_until) + 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def succeeded(self):
+        self.rate = min(self.rate + RATE_STEP_UP, MAX_RATE)
+
+    def throttled(self, retry_after: float | None = None):
+        self.rate = max(self.rate * RATE_BACKOFF, MIN_RATE)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+_buckets = {}
+
+def bucket_for(host: str) -> TokenBucket:
+    bucket = _buckets.get(host)
+    if bucket is None:
+        bucket = _buckets[host] = TokenBucket()
+    return bucket
+
+def snapshot() -> dict:
+    """
+    Current state of every host's bucket, for the admin commands.
+    """
+    now = time.monotonic()
+    return {
+        host: {
+            "tokens": round(bucket.tokens(), 2),
+            "burst": bucket.burst,
+            "rate": round(bucket.rate, 3),
+            "queue_wait": round(bucket.wait_time(), 2),
+            "blocked_for": round(max(bucket.blocked_until - now, 0.0), 1),
+        }
+        for host, bucket in sorted(_buckets.items())
+    }
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter for retry number `attempt` (0-based).
+    """
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-After in seconds, from either the delta-seconds or HTTP-date form.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
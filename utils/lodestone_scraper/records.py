@@ -0,0 +1,209 @@
+"""
+Typed records for scrape results, generated from the selector registry.
+Instead of nested dicts of strings and regex groupdicts, each selector file (and each block and regex field in it)
+gets a slotted dataclass, with levels, EXP, IDs and the like turned into ints and Lodestone timestamps into datetimes
+as the record is built. Thousands of these held in memory (rosters, refresh batches) are a fraction of the size of the
+equivalent dicts, and nobody has to re-split NAME or isinstance-check SERVER again.
+
+    character = await scraper.scrape("profile.character", lodestone_id, records=True)
+    character.SERVER.World, character.forename, character.ACTIVE_CLASSJOB_LEVEL  # str, str, int
+
+Classes are built the first time they're asked for and rebuilt if the selector file changes, like the registry itself.
+Every field defaults to None, so a record can be filled in partially (see LodestoneScraper.scrape_record).
+"""
+
+import re
+from dataclasses import field, make_dataclass
+from datetime import datetime, timezone
+
+from .selectors import FieldSelector, FieldOpsSelector, GroupSelector
+
+_DIGITS = re.compile(r"\d+")
+_SEPARATORS = re.compile(r"(?<=\d)[,.\s](?=\d)")  # thousands separators, not the dot in "Lv. 90"
+
+def to_int(text):
+    """
+    "1,234,567" (or "1.234.567" on the German site) -> 1234567, "Lv. 90" -> 90, "-" / "--" (locked, level cap) -> None.
+    """
+    if text is None or isinstance(text, int):
+        return text
+    match = _DIGITS.search(_SEPARATORS.sub("", text))
+    return int(match.group()) if match else None
+
+def to_datetime(text):
+    # ldst_strftime() timestamps are unix seconds
+    timestamp = to_int(text)
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp is not None else None
+
+# Plain fields that are numbers on the page, by key
+INT_FIELDS = frozenset({
+    "LEVEL", "ACTIVE_MEMBER_COUNT", "ACHIEVEMENT_POINTS", "ITEM_LEVEL",
+    "HP", "MP_GP_CP", "STRENGTH", "DEXTERITY", "VITALITY", "INTELLIGENCE", "MIND", "CRITICAL_HIT_RATE", "DETERMINATION",
+    "DIRECT_HIT_RATE", "DEFENSE", "MAGIC_DEFENSE", "ATTACK_POWER", "SKILL_SPEED", "ATTACK_MAGIC_POTENCY",
+    "HEALING_MAGIC_POTENCY", "SPELL_SPEED", "TENACITY", "PIETY",
+})
+
+# Regex groups that need converting, by group name, the rest stay strings
+GROUP_CONVERTERS = {
+    "ID": to_int,
+    "Level": to_int,
+    "CurrentEXP": to_int,
+    "MaxEXP": to_int,
+    "Mettle": to_int,
+    "CurrentPage": to_int,
+    "NumPages": to_int,
+    "TotalAchievements": to_int,
+    "Timestamp": to_datetime,
+}
+
+_GROUP_TYPES = {to_int: int | None, to_datetime: datetime | None}
+
+
+class CharacterMixin:
+    """
+    Conveniences on profile/character records, the name and world split the way verification stores them.
+    """
+    __slots__ = ()
+
+    @property
+    def forename(self) -> str:
+        return (self.NAME or "").split(" ", 1)[0]
+
+    @property
+    def surname(self) -> str:
+        parts = (self.NAME or "").split(" ", 1)
+        return parts[1] if len(parts) > 1 else ""
+
+    @property
+    def server_name(self) -> str:
+        return (self.SERVER.World if self.SERVER is not None else None) or ""
+
+    @property
+    def data_center_name(self) -> str:
+        return (self.SERVER.DC if self.SERVER is not None else None) or ""
+
+# Extra behaviour for a selector file's top level record, by (category, filename)
+RECORD_MIXINS = {
+    ("profile", "character"): CharacterMixin,
+}
+
+
+class Conversion:
+    """
+    How to turn one raw extracted value into its typed form. `record_class` is the generated class, if there is one.
+    """
+    __slots__ = ("convert", "annotation", "record_class")
+
+    def __init__(self, convert, annotation, record_class=None):
+        self.convert = convert
+        self.annotation = annotation
+        self.record_class = record_class
+
+
+_conversions = {}  # (category, filename) -> (mtime, {(keys, entry): Conversion})
+
+def conversion_for(plan, keys=(), entry: bool = False) -> Conversion:
+    """
+    The Conversion for plan.resolve(keys). With entry=True it converts one record of a list block
+    (what iter_records()/iter_pages() yield) instead of the whole list.
+    """
+    cached = _conversions.get((plan.category, plan.filename))
+    if cached is None or cached[0] != plan.mtime:
+        cached = _conversions[(plan.category, plan.filename)] = (plan.mtime, {})
+    table = cached[1]
+    lookup = (tuple(keys), entry)
+    if lookup not in table:
+        target = plan.resolve(list(keys))
+        name = _class_name(plan, keys)
+        if entry:
+            table[lookup] = _build_entry(target, name)
+        else:
+            mixin = RECORD_MIXINS.get((plan.category, plan.filename)) if not keys else None
+            table[lookup] = _build(target, name, keys[-1] if keys else None, mixin)
+    return table[lookup]
+
+def convert(plan, keys, value):
+    """
+    Raw extract_element() value for plan.resolve(keys) -> record (or typed scalar, or list of either).
+    """
+    return conversion_for(plan, keys).convert(value)
+
+def partial(plan, keys, values: dict):
+    """
+    A record for plan.resolve(keys) with just these (already converted) top level fields filled in.
+    """
+    record_class = conversion_for(plan, keys).record_class
+    if record_class is None:
+        raise TypeError(f"{plan.category}.{plan.filename} {list(keys)} is a single field, not a block")
+    return record_class(**values)
+
+def _class_name(plan, keys) -> str:
+    # ("profile", "classjob", ["PALADIN", "EXP"]) -> ClassjobPaladinExp, the file itself -> ClassjobRecord
+    if not keys:
+        return plan.filename.title().replace("_", "") + "Record"
+    return plan.filename.title().replace("_", "") + "".join(key.title().replace("_", "") for key in keys)
+
+def _build(node, name: str, key: str | None, mixin=None) -> Conversion:
+    if isinstance(node, FieldOpsSelector):
+        return _scalar(key)
+    if isinstance(node, FieldSelector):
+        one = _regex_fields(node, name) if node.regex is not None else _scalar(key)
+        if not node.multiple:
+            return one
+        convert_one = one.convert
+        return Conversion(lambda values: [convert_one(value) for value in values] if values is not None else None, list)
+    if node.entry_root is not None:
+        entry = _build_entry(node, name)
+        convert_entry = entry.convert
+        return Conversion(
+            lambda records: [convert_entry(record) for record in records] if records is not None else None, list, entry.record_class
+        )
+    return _record(name, node.children, mixin)
+
+def _build_entry(node, name: str) -> Conversion:
+    if not isinstance(node, GroupSelector) or node.entry_root is None:
+        raise TypeError(f"{name} isn't a list block")
+    return _record(name, node.fields)
+
+def _record(name: str, children: dict, mixin=None) -> Conversion:
+    prefix = name.removesuffix("Record")
+    parts = {key: _build(sub, prefix + key.title().replace("_", ""), key) for key, sub in children.items()}
+    record_class = make_dataclass(
+        name,
+        [(key, part.annotation, field(default=None)) for key, part in parts.items()],
+        bases=(mixin,) if mixin is not None else (),
+        slots=True,
+    )
+    converters = [(key, part.convert) for key, part in parts.items()]
+
+    def convert(value):
+        if value is None:
+            return None
+        return record_class(**{key: convert_child(value.get(key)) for key, convert_child in converters})
+    return Conversion(convert, record_class | None, record_class)
+
+def _regex_fields(node: FieldSelector, name: str) -> Conversion:
+    groups = list(node.regex.groupindex)
+    converters = [(group, GROUP_CONVERTERS.get(group)) for group in groups]
+    record_class = make_dataclass(
+        name,
+        [(group, _GROUP_TYPES.get(converter, str | None), field(default=None)) for group, converter in converters],
+        slots=True,
+    )
+
+    def convert(match):
+        if match is None:
+            return None
+        return record_class(**{
+            group: converter(match.get(group)) if converter is not None else match.get(group)
+            for group, converter in converters
+        })
+    return Conversion(convert, record_class | None, record_class)
+
+def _scalar(key: str | None) -> Conversion:
+    if key in INT_FIELDS:
+        return Conversion(to_int, int | None)
+    return Conversion(_same, str | None)
+
+def _same(value):
+    return value
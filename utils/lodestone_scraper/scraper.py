@@ -1,92 +1,422 @@
+import asyncio
+import contextlib
+import logging
+import time
+from urllib.parse import urlencode, urlsplit
 import aiohttp
-from bs4 import BeautifulSoup
 from .uris import applicable_uris
-from .selectors import load_selectors, DEFAULT_FILES  # centralize default logic here
-from .extract import extract_element
+from .selectors import registry, parse_selector_string, FieldSelector  # centralize default logic here
+from .extract import extract_element, iter_records
+from .backends import Document, get_backend
+from . import archive, breaker, httpclient, metrics, pagecache, parsepool, ratelimit, records as typed, streaming
+from .singleflight import page_flights, redis_coalesce
+from .errors import URIBuilderError, LodestoneHTTPError, LodestoneUnavailable, RateLimitDeadlineExceeded
 
-class SelectorNotFound(Exception):
-    pass
+logger = logging.getLogger("bot")
 
-class URIBuilderError(Exception):
-    pass
+# Region for scrapers that weren't given one. Everything the bot scrapes should share one host, so it all queues in
+# the same rate limiter bucket and trips the same circuit breaker (see set_default_region)
+_default_region = "eu"
+
+# Where requests go instead of https://<region>.finalfantasyxiv.com, None means the real thing (see set_default_base_url)
+_default_base_url = None
+
+def set_default_region(region: str):
+    """
+    Sets the region every scraper that wasn't given its own region uses, e.g. settings.LODESTONE_REGION at startup.
+    """
+    global _default_region
+    _default_region = region
+
+def set_default_base_url(base_url: str | None):
+    """
+    Points every scraper that wasn't given its own base_url somewhere else, e.g. the stand-in server in standin.py.
+    """
+    global _default_base_url
+    _default_base_url = base_url.rstrip("/") if base_url else None
 
 class LodestoneScraper:
-    def __init__(self, region="eu", session=None, timeout=15):
-        self.region = region
+    def __init__(self, region=None, session=None, timeout=15, parser=None, cache=True, coalesce=True, redis_coalesce=False, offload=True, max_body=streaming.MAX_BODY, base_url=None):
+        self.region = region or _default_region
         self.timeout = timeout
-        self.session = session  # allows passing an existing aiohttp session for reuse
+        self.session = session  # allows passing an existing aiohttp session, otherwise the shared httpclient pool is used
+        self.parser = parser  # "bs4" or "selectolax", None follows backends.set_default_backend()
+        self.cache = cache  # False skips the Redis page cache entirely (scripts, benchmarks)
+        self.coalesce = coalesce  # concurrent scrapes of the same page share one download + parse
+        self.redis_coalesce = redis_coalesce  # ...and across bot processes too, through a Redis lock (needs cache)
+        self.offload = offload  # parse + extract on the parsepool workers when the pool is running
+        self.max_body = max_body  # bytes, bigger pages raise LodestoneBodyTooLarge
+        self.base_url = base_url.rstrip("/") if base_url else None  # e.g. "http://127.0.0.1:8080" for load tests
+
+    @property
+    def backend(self):
+        return get_backend(self.parser)
+
+    @property
+    def host(self):
+        # Where our requests go, i.e. which rate limiter bucket they queue in
+        return urlsplit(self.base_url or _default_base_url or f"https://{self.region}.finalfantasyxiv.com").hostname
 
     @staticmethod
     def list_available_selectors():
-        # You can expand this to dynamically read files if you want
-        from pathlib import Path
-        selector_root = Path(__file__).parent / "selectors"
+        # Straight from the compiled registry, no disk reads
         selectors = []
-        for folder in selector_root.iterdir():
-            if folder.is_dir():
-                for jsonfile in folder.glob("*.json"):
-                    with open(jsonfile, encoding="utf-8") as f:
-                        d = json.load(f)
-                    for key in d:
-                        selectors.append(f"{folder.name}.{jsonfile.stem}.{key}")
+        for plan in registry.plans():
+            for key in plan.root.children:
+                selectors.append(f"{plan.category}.{plan.filename}.{key}")
         return selectors
 
     def _parse_selector_string(self, selector: str):
-        parts = selector.split(".")
-        if len(parts) == 1:
-            category = parts[0]
-            file = DEFAULT_FILES.get(category, category)
-            keys = []
-        elif len(parts) == 2:
-            category, file = parts
-            keys = []
-        else:
-            category, file, *keys = parts
-        return category, file, keys
-
-    async def scrape(self, selector_string, lodestone_id, *extra_ids):
-        # Parse selector string
-        category, file, keys = self._parse_selector_string(selector_string)
+        return parse_selector_string(selector)
 
-        # Build selector path and URI key
-        selector_dict = load_selectors(category, file)
-        uri_key = f"{category}/{file}.json"
+    def _build_url(self, plan, lodestone_id, extra_ids, params=None):
+        uri_key = plan.uri_key
 
         # Build the URI
         if uri_key not in applicable_uris:
             raise URIBuilderError(f"No URI template for {uri_key}")
+        template = applicable_uris[uri_key]
 
-        # Prepare URL
-        ids = (str(lodestone_id),) + tuple(str(i) for i in extra_ids)
-        url = applicable_uris[uri_key] % ((self.region,) + ids)
+        # Prepare URL, search pages take no ID at all, just query params
+        ids = tuple(str(i) for i in (lodestone_id, *extra_ids) if i is not None)
+        needed = template.count("%s") - 1
+        if len(ids) != needed:
+            raise URIBuilderError(f"{uri_key} needs {needed} ID(s), got {len(ids)}")
+        url = template % ((self.region,) + ids)
+        base_url = self.base_url or _default_base_url
+        if base_url:
+            # Same path, different host
+            url = base_url + urlsplit(url).path
+        if params:
+            url += "?" + urlencode(params)
+        return url
 
-        # Download HTML
-        session = self.session or aiohttp.ClientSession()
+    @contextlib.asynccontextmanager
+    async def _session_scope(self):
+        # The session we were handed, or the bot-wide pool, or a throwaway one if the pool isn't running (scripts etc)
+        session = self.session or httpclient.get_session()
+        if session is not None:
+            yield session
+            return
+        session = aiohttp.ClientSession(trace_configs=[metrics.trace_config()])
         try:
-            async with session.get(url, timeout=self.timeout, headers={"User-Agent": "LodestoneScraper/1.0"}) as resp:
-                if resp.status != 200:
-                    raise Exception(f"HTTP {resp.status}: Failed to fetch page.")
-                html = await resp.text()
+            yield session
         finally:
-            if not self.session:
-                await session.close()
-
-        # Parse HTML and extract fields
-        soup = BeautifulSoup(html, "lxml")
-        target = selector_dict
-        for key in keys:
-            if key not in target:
-                raise SelectorNotFound(f"Key '{key}' not found in selector JSON.")
-            target = target[key]
-
-        # If you want a specific field, extract just that
+            await session.close()
+
+    def _offloading(self):
+        return self.offload and parsepool.running()
+
+    async def _load_page(self, session, url, ttl, bypass_cache=False, max_wait=None, watcher=None, labels=None):
+        """
+        Downloads and parses a page, concurrent callers asking for the same thing share a single run.
+        When the parse pool is running the page comes back as raw HTML instead, parsing happens on a worker in _extract_page.
+        With a streaming watcher the page may be cut short once the watched fields are in, so that run is never shared.
+        labels are what the metrics get filed under, see metrics.label().
+        """
+        offloading = self._offloading()
+        labels = labels or (self.region, "unknown")
+
+        async def load():
+            html = await self._fetch(session, url, ttl, bypass_cache, max_wait, watcher, labels)
+            if offloading:
+                return html
+            with metrics.timer("parse", labels):
+                return self.backend.parse(html)
+
+        if not self.coalesce or watcher is not None:
+            return await load()
+        return await page_flights.do((url, "html" if offloading else self.backend.name, bypass_cache, ttl), load)
+
+    async def _extract_page(self, page, wanted, labels=None):
+        """
+        Extracts every (plan, keys, target) in wanted from one loaded page, returns the raw values in the same order.
+        A Document is extracted right here, raw HTML goes off to the parse pool.
+        """
+        labels = labels or (self.region, "unknown")
+        if isinstance(page, Document):
+            with metrics.timer("extract", labels):
+                return [extract_element(page, target) for _, _, target in wanted]
+        refs = [(plan.category, plan.filename, keys) for plan, keys, _ in wanted]
+        timings = {}
+        values = await parsepool.extract(page, self.backend.name, refs, timings)
+        for stage, seconds in timings.items():
+            metrics.observe(stage, labels, seconds)
+        return values
+
+    async def _fetch(self, session, url, ttl, bypass_cache=False, max_wait=None, watcher=None, labels=None):
+        labels = labels or (self.region, "unknown")
+        # Serve from the page cache if our copy is fresh enough for whoever's asking
+        cached = await pagecache.lookup(url) if self.cache and not bypass_cache else None
+        if cached is not None and cached.is_fresh(ttl):
+            metrics.count("cache_hit", labels)
+            return cached.body
+        if not self.cache or bypass_cache:
+            metrics.count("cache_bypass", labels)
+        else:
+            metrics.count("cache_stale" if cached is not None else "cache_miss", labels)
+
+        if self.redis_coalesce and self.cache and not bypass_cache and watcher is None:
+            async def cached_body():
+                page = await pagecache.lookup(url)
+                return page.body if page is not None and page.is_fresh(ttl) else None
+            return await redis_coalesce(url, lambda: self._download(session, url, cached, max_wait, labels=labels), cached_body)
+        return await self._download(session, url, cached, max_wait, watcher, labels)
+
+    async def _download(self, session, url, cached=None, max_wait=None, watcher=None, labels=None):
+        # Go to the network, asking to revalidate our stale copy if we have one
+        labels = labels or (self.region, "unknown")
+        headers = {"User-Agent": "LodestoneScraper/1.0"}
+        if cached is not None:
+            headers.update(cached.revalidation_headers())
+
+        host = urlsplit(url).hostname
+        bucket = ratelimit.bucket_for(host)
+        circuit = breaker.breaker_for(host)
+        deadline = None if max_wait is None else asyncio.get_running_loop().time() + max_wait
+        attempt = 0
+        while True:
+            try:
+                # Lodestone's down, fail now rather than queue for a slot and then sit out the timeout
+                circuit.check()
+                remaining = None if deadline is None else deadline - asyncio.get_running_loop().time()
+                with metrics.timer("queue", labels):
+                    await bucket.acquire(remaining)
+                probe = circuit.allow()
+            except LodestoneUnavailable:
+                metrics.count("circuit_rejected", labels)
+                raise
+
+            retry_after = None
+            connect = metrics.ConnectTiming()
+            try:
+                # Keep the session's connect timeout, only the overall deadline is per-scraper
+                timeout = aiohttp.ClientTimeout(total=self.timeout, connect=session.timeout.connect)
+                sent = time.perf_counter()
+                async with session.get(url, timeout=timeout, headers=headers, trace_request_ctx=connect) as resp:
+                    metrics.observe("connect", labels, connect.seconds)
+                    metrics.observe("ttfb", labels, time.perf_counter() - sent - connect.seconds)
+                    metrics.count(f"status_{resp.status}", labels)
+                    if resp.status >= 500:
+                        downtime = breaker.maintenance_retry_after(resp.status, resp.headers.get("Retry-After"))
+                        if downtime is not None:
+                            metrics.count("maintenance", labels)
+                            circuit.under_maintenance(downtime)
+                            raise circuit.unavailable() from LodestoneHTTPError(resp.status, url)
+                        circuit.failed(f"HTTP {resp.status}")
+                    else:
+                        circuit.succeeded()
+                    if resp.status == 304 and cached is not None:
+                        bucket.succeeded()
+                        await pagecache.mark_revalidated(url)
+                        return cached.body
+                    if resp.status == 200:
+                        with metrics.timer("body", labels):
+                            html, complete = await streaming.read_body(resp, url, watcher, self.max_body)
+                        metrics.count("bytes", labels, resp.content.total_bytes)
+                        if not complete:
+                            metrics.count("stopped_early", labels)
+                        bucket.succeeded()
+                        break
+                    if resp.status not in ratelimit.RETRY_STATUSES:
+                        raise LodestoneHTTPError(resp.status, url)
+                    retry_after = ratelimit.parse_retry_after(resp.headers.get("Retry-After"))
+                    bucket.throttled(retry_after)
+                    failure = LodestoneHTTPError(resp.status, url)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                metrics.count(f"error_{type(exc).__name__}", labels)
+                circuit.failed(type(exc).__name__)
+                failure = exc
+            finally:
+                if probe:
+                    circuit.release_probe()
+
+            # That was one failure too many (or a failed probe), no point retrying into an open circuit
+            if circuit.state != breaker.CLOSED:
+                raise circuit.unavailable() from failure
+            # Retry with backoff, unless we're out of attempts or the wait would blow the caller's deadline
+            if attempt >= ratelimit.MAX_RETRIES:
+                raise failure
+            metrics.count("retries", labels)
+            delay = retry_after if retry_after is not None else ratelimit.backoff_delay(attempt)
+            if deadline is not None:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if delay > remaining:
+                    raise RateLimitDeadlineExceeded(delay, max(remaining, 0.0)) from failure
+            logger.info("Lodestone fetch of %s failed (%s), retry %s in %.1fs", url, failure, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        # A page we stopped reading halfway is no good to anyone else
+        if complete:
+            if self.cache:
+                await pagecache.store(url, html, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+            archive.record(url, html)  # no-op unless the archive is on
+        return html
+
+    @staticmethod
+    def _watcher(wanted):
+        return streaming.watcher_for([target for _, _, _, target in wanted])
+
+    @staticmethod
+    def _extract(doc, keys, target):
+        return LodestoneScraper._shape(keys, target, extract_element(doc, target))
+
+    @staticmethod
+    def _shape(keys, target, value):
+        # If you want a specific field, you get just that
         if keys:
             # Only that one entry
-            if isinstance(target, dict) and "selector" in target:
-                return extract_element(soup, target)
+            if isinstance(target, FieldSelector):
+                return value
             else:
                 # Nested composite
-                return {keys[-1]: extract_element(soup, target)}
+                return {keys[-1]: value}
         else:
-            # Extract all top-level entries
-            return {field: extract_element(soup, entry) for field, entry in target.items()}
+            # All top-level entries
+            return value
+
+    async def scrape(self, selector_string, lodestone_id=None, *extra_ids, params=None, bypass_cache=False, max_wait=None, stream=False, records=False):
+        results = await self.scrape_many(
+            [selector_string], lodestone_id, *extra_ids,
+            params=params, bypass_cache=bypass_cache, max_wait=max_wait, stream=stream, records=records,
+        )
+        return results[selector_string]
+
+    async def scrape_record(self, selector_string, lodestone_id=None, *extra_ids, fields=None, **kwargs):
+        """
+        Scrapes a selector file (or block) as a typed record, see records.py.
+        With fields only those top level keys are scraped and filled in, the rest stay None, so something like
+        scrape_record("profile.character", id, fields=["BIO", "NAME", "SERVER"], stream=True) still streams.
+        Takes the same keyword arguments as scrape_many.
+        """
+        if fields is None:
+            return await self.scrape(selector_string, lodestone_id, *extra_ids, records=True, **kwargs)
+        plan, keys = registry.resolve(selector_string)
+        path = ".".join([plan.category, plan.filename, *keys])
+        wanted = {key: f"{path}.{key}" for key in fields}
+        values = await self.scrape_many(list(wanted.values()), lodestone_id, *extra_ids, records=True, **kwargs)
+        return typed.partial(plan, keys, {key: values[string] for key, string in wanted.items()})
+
+    async def scrape_many(self, selector_strings, lodestone_id=None, *extra_ids, params=None, bypass_cache=False, max_wait=None, stream=False, records=False):
+        """
+        Scrapes several selector strings for the same ID in one go.
+        Selectors are grouped by the page they live on, so each page is downloaded and parsed once no matter how many fields you want from it.
+        Pages come from the Redis page cache when fresh enough, bypass_cache=True forces a live download (verification reads).
+        Requests go through the per-host rate limiter and back off on 429/503, max_wait (seconds) caps how long we're willing
+        to queue or back off before giving up with RateLimitDeadlineExceeded.
+        params are added as a query string, that's how search pages get their terms.
+        stream=True parses pages as they download and stops reading once every wanted field is in, great for a couple of
+        fields near the top of a big page. Selectors that need the whole page (lists, multiple, field ops) just read it all.
+        Returns {selector_string: result}, each result shaped exactly like scrape() would give you.
+        records=True gives typed records (records.py) instead of dicts, a block comes back as its record rather than {KEY: ...}.
+        """
+        # Parse selector strings into compiled plans (cached, reloaded if the file changed) and group them by URL
+        started = time.perf_counter()
+        pages = {}
+        ttls = {}
+        for selector_string in selector_strings:
+            plan, keys = registry.resolve(selector_string)
+            target = plan.resolve(keys)
+            url = self._build_url(plan, lodestone_id, extra_ids, params)
+            pages.setdefault(url, []).append((selector_string, plan, keys, target))
+            # Several files can share a page, the strictest freshness wins
+            ttl = pagecache.ttl_for(plan.uri_key)
+            ttls[url] = min(ttls[url], ttl) if url in ttls else ttl
+
+        # A page's metrics are filed under the first selector file that wanted it
+        labels = {url: metrics.label(self.region, wanted[0][1]) for url, wanted in pages.items()}
+
+        # Download and parse, one request per distinct page
+        async with self._session_scope() as session:
+            urls = list(pages)
+            docs = await asyncio.gather(*(
+                self._load_page(
+                    session, url, ttls[url], bypass_cache, max_wait, self._watcher(pages[url]) if stream else None, labels[url]
+                )
+                for url in urls
+            ))
+
+        # Each page was parsed once, extract every field wanted from it (on the parse pool if it's running)
+        values = await asyncio.gather(*(
+            self._extract_page(doc, [(plan, keys, target) for _, plan, keys, target in pages[url]], labels[url])
+            for url, doc in zip(urls, docs)
+        ))
+        for url in urls:
+            metrics.observe("total", labels[url], time.perf_counter() - started)
+        results = {}
+        for url, page_values in zip(urls, values):
+            for (selector_string, plan, keys, target), value in zip(pages[url], page_values):
+                # Typed records get built here rather than on the parse pool, generated classes don't pickle
+                results[selector_string] = typed.convert(plan, keys, value) if records else self._shape(keys, target, value)
+        return results
+
+    async def iter_pages(self, selector_string, lodestone_id=None, *extra_ids, params=None, window=4, bypass_cache=False, max_wait=None, records=False):
+        """
+        Streams the ENTRY records of a paginated list (FC members, achievements, search results), page after page.
+        Page 1 tells us NumPages, the rest are prefetched up to `window` pages at a time and yielded in page order as they land.
+        Breaking out early cancels whatever is still downloading, wrap it in contextlib.aclosing() if you want that to happen right away:
+
+            async with contextlib.aclosing(scraper.iter_pages("freecompany.members", fc_id)) as members:
+                async for member in members:
+                    ...
+
+        records=True yields typed entry records (records.py) instead of dicts.
+        """
+        plan, _ = registry.resolve(selector_string)
+        entry = plan.resolve(["ENTRY"])
+        page_info = plan.root.children.get("PAGE_INFO")  # no pager (pvpteam members) means it's all on one page
+        ttl = pagecache.ttl_for(plan.uri_key)
+        params = dict(params or {})
+        convert = typed.conversion_for(plan, ["ENTRY"], entry=entry.entry_root is not None).convert if records else None
+        labels = metrics.label(self.region, plan)
+
+        async with self._session_scope() as session:
+            async def load(page):
+                url = self._build_url(plan, lodestone_id, extra_ids, {**params, "page": page} if page > 1 else params)
+                started = time.perf_counter()
+                loaded = await self._load_page(session, url, ttl, bypass_cache, max_wait, labels=labels)
+                if isinstance(loaded, Document):
+                    # Entries are extracted lazily as they're yielded, so only the page info counts as extract here
+                    with metrics.timer("extract", labels):
+                        info = extract_element(loaded, page_info) if page_info is not None else None
+                    metrics.observe("total", labels, time.perf_counter() - started)
+                    return info, _entries(loaded, entry)
+                # Parse pool, the whole page comes back extracted in one go
+                wanted = [(plan, ["ENTRY"], entry)]
+                if page_info is not None:
+                    wanted.append((plan, ["PAGE_INFO"], page_info))
+                values = await self._extract_page(loaded, wanted, labels)
+                metrics.observe("total", labels, time.perf_counter() - started)
+                entries = values[0] if entry.entry_root is not None else [values[0]]
+                return (values[1] if page_info is not None else None), iter(entries)
+
+            info, entries = await load(1)
+            num_pages = int(info["NumPages"]) if info else 1
+            for record in entries:
+                yield convert(record) if convert else record
+            del entries
+
+            pending = {}
+            next_page = 2
+            try:
+                for page in range(2, num_pages + 1):
+                    # Keep the prefetch window topped up
+                    while next_page <= num_pages and len(pending) < max(window, 1):
+                        pending[next_page] = asyncio.ensure_future(load(next_page))
+                        next_page += 1
+                    _, entries = await pending.pop(page)
+                    for record in entries:
+                        yield convert(record) if convert else record
+            finally:
+                for task in pending.values():
+                    task.cancel()
+
+def _entries(doc, entry):
+    """
+    The ENTRY records on one list page, generated one at a time.
+    """
+    if entry.entry_root is not None:
+        return iter_records(doc, entry)
+    # A lone ENTRY block without a multiple ROOT is just one record
+    return iter([extract_element(doc, entry)])
@@ -1,5 +1,12 @@
 from pathlib import Path
+import copy
 import json
+import re
+import threading
+
+import soupsieve
+
+from .errors import SelectorNotFound
 
 # Central place to update if your structure changes
 SELECTOR_ROOT = Path(__file__).parent / "selectors"
@@ -12,19 +19,326 @@ DEFAULT_FILES = {
     # Add more as needed
 }
 
-def load_selectors(category: str, filename: str) -> dict:
+##########################
+### Compiled selectors ###
+##########################
+
+class FieldSelector:
     """
-    Loads the selector dict for a given category/folder and filename.
+    A single leaf of a selector file: one CSS selector, plus the optional attribute, regex and multiple flag.
+    The CSS is parsed by soupsieve and the regex compiled once, when the file is loaded.
+    """
+    __slots__ = ("selector", "css", "attribute", "regex", "multiple")
+
+    def __init__(self, raw: dict):
+        self.selector = raw["selector"]
+        self.css = soupsieve.compile(self.selector)
+        self.attribute = raw.get("attribute")
+        self.regex = re.compile(raw["regex"]) if "regex" in raw else None
+        self.multiple = bool(raw.get("multiple"))
+
+class FieldOpsSelector:
+    """
+    A header-based field ops lookup (Bozja, Eureka, Occult Crescent etc) instead of a CSS selector.
+    """
+    __slots__ = ("header", "data_index")
+
+    def __init__(self, raw: dict):
+        self.header = raw["_field_ops_header"]
+        self.data_index = raw.get("_data_index", 0)
+
+class GroupSelector:
+    """
+    A nested block of selectors (FC crest layers, gear slots etc), maps key -> compiled child.
+    If the block has a ROOT with multiple: true it's a list (FC members, search results...), `entry_root` is that ROOT
+    and `fields` are its siblings, to be evaluated inside each ROOT match instead of against the whole page.
+    """
+    __slots__ = ("children", "entry_root", "fields", "_trie")
+
+    def __init__(self, raw: dict):
+        self.children = {key: compile_selector(sub) for key, sub in raw.items()}
+        self._trie = None
+        root = self.children.get("ROOT")
+        if isinstance(root, FieldSelector) and root.multiple:
+            self.entry_root = root
+            self.fields = {key: sub for key, sub in self.children.items() if key != "ROOT"}
+        else:
+            self.entry_root = None
+            self.fields = self.children
+
+    @property
+    def trie(self):
+        """
+        The shared-prefix trie of every plain field in this block (nested blocks included), built on first use.
+        """
+        if self._trie is None:
+            self._trie = build_prefix_trie(self)
+        return self._trie
+
+def compile_selector(raw: dict):
+    """
+    Compiles a raw selector dict (as found in the JSON files) into its FieldSelector/FieldOpsSelector/GroupSelector.
     """
-    file_path = SELECTOR_ROOT / category / f"{filename}.json"
-    if not file_path.exists():
-        raise FileNotFoundError(f"Selector file not found: {file_path}")
+    if raw.get("_field_ops_header"):
+        return FieldOpsSelector(raw)
+    if "selector" in raw:
+        return FieldSelector(raw)
+    return GroupSelector(raw)
+
+###########################
+### Shared-prefix tries ###
+###########################
+
+# gearset.json and classjob.json are hundreds of `a > b > div:nth-child(1) > ...` chains that mostly start the same way,
+# so instead of running each one from the top we share the common steps and walk the page once.
+
+_CHILD_STEP = re.compile(
+    r"(?P<tag>[a-zA-Z][\w-]*|\*)?"
+    r"(?P<rest>(?:\.[\w-]+|#[\w-]+|:nth-(?:child|of-type)\(\s*\d+\s*\))*)"
+)
+_STEP_PART = re.compile(
+    r"\.(?P<cls>[\w-]+)|#(?P<id>[\w-]+)|:nth-child\(\s*(?P<nth>\d+)\s*\)|:nth-of-type\(\s*(?P<nth_of_type>\d+)\s*\)"
+)
+_COMBINATOR = re.compile(r"\s*>\s*")
+
+class ChildStep:
+    """
+    One `tag.class#id:nth-child(N)` (or `tag:nth-of-type(N)`) step after a `>` in a chain, simple enough to check by hand.
+    """
+    __slots__ = ("text", "tag", "classes", "id", "nth", "nth_of_type")
+
+    def __init__(self, text: str):
+        match = _CHILD_STEP.fullmatch(text)
+        self.text = text
+        self.tag = match["tag"].lower() if match["tag"] and match["tag"] != "*" else None
+        self.classes = []
+        self.id = None
+        self.nth = None
+        self.nth_of_type = None
+        for part in _STEP_PART.finditer(match["rest"]):
+            if part["cls"]:
+                self.classes.append(part["cls"])
+            elif part["id"]:
+                self.id = part["id"]
+            elif part["nth"]:
+                self.nth = int(part["nth"])
+            else:
+                self.nth_of_type = int(part["nth_of_type"])
+
+class PrefixNode:
+    """
+    A trie node: the step that gets here, the steps that can follow it, and the fields whose selector ends here.
+    The first step of a chain is a FieldSelector (run with the backend's CSS engine), every later one a ChildStep.
+    """
+    __slots__ = ("step", "children", "fields")
+
+    def __init__(self, step):
+        self.step = step
+        self.children = {}
+        self.fields = []
+
+    def all_fields(self):
+        yield from self.fields
+        for child in self.children.values():
+            yield from child.all_fields()
+
+class PrefixTrie:
+    """
+    `roots` maps a chain's first step to its node, `loose` are fields whose selector isn't a plain `>` chain.
+    """
+    __slots__ = ("roots", "loose")
+
+    def __init__(self):
+        self.roots = {}
+        self.loose = []
+
+def split_child_chain(selector: str, simple_first: bool = False):
+    """
+    Splits "a > b:nth-child(2) > .c" into its steps, or returns None if it's not a `>` chain we can walk ourselves.
+    The first step can be any compound selector (unless simple_first), the rest have to be ChildStep-simple.
+    """
+    if any(ch in selector for ch in ",+~\"'"):
+        return None
+    steps = _COMBINATOR.split(selector.strip())
+    if any(not step or any(ch.isspace() for ch in step) for step in steps):
+        return None
+    for step in (steps if simple_first else steps[1:]):
+        match = _CHILD_STEP.fullmatch(step)
+        # nth-of-type without a tag counts per tag name, not worth doing by hand
+        if match is None or (":nth-of-type" in step and match["tag"] in (None, "*")):
+            return None
+    return steps
+
+def build_prefix_trie(group: GroupSelector) -> PrefixTrie:
+    """
+    Builds the trie for every FieldSelector under group, following nested blocks but not lists or field ops.
+    """
+    trie = PrefixTrie()
+    for field in _plain_fields(group):
+        steps = split_child_chain(field.selector)
+        if steps is None:
+            trie.loose.append(field)
+            continue
+        first, *rest = steps
+        node = trie.roots.get(first)
+        if node is None:
+            node = trie.roots[first] = PrefixNode(FieldSelector({"selector": first}))
+        for text in rest:
+            child = node.children.get(text)
+            if child is None:
+                child = node.children[text] = PrefixNode(ChildStep(text))
+            node = child
+        node.fields.append(field)
+    return trie
+
+def _plain_fields(group: GroupSelector):
+    for sub in group.children.values():
+        if isinstance(sub, FieldSelector):
+            yield sub
+        elif isinstance(sub, GroupSelector) and sub.entry_root is None:
+            yield from _plain_fields(sub)
+
+class SelectorPlan:
+    """
+    One selector file, compiled and ready to run against a page.
+    `mtime` is the file's modification time when it was compiled, the registry uses it to notice edits.
+    """
+    __slots__ = ("category", "filename", "path", "mtime", "raw", "root")
+
+    def __init__(self, category: str, filename: str, path: Path, mtime: int, raw: dict):
+        self.category = category
+        self.filename = filename
+        self.path = path
+        self.mtime = mtime
+        self.raw = raw
+        self.root = GroupSelector(raw)
+
+    @property
+    def uri_key(self) -> str:
+        return f"{self.category}/{self.filename}.json"
+
+    def resolve(self, keys):
+        """
+        Walks down the compiled tree following keys, e.g. ["FREE_COMPANY", "NAME"].
+        """
+        node = self.root
+        for key in keys:
+            if not isinstance(node, GroupSelector) or key not in node.children:
+                raise SelectorNotFound(f"Key '{key}' not found in selector JSON.")
+            node = node.children[key]
+        return node
+
+################
+### Registry ###
+################
+
+def parse_selector_string(selector: str):
+    """
+    Splits "category.file.KEY.SUBKEY" into (category, file, [keys]).
+    A bare category ("profile") resolves through DEFAULT_FILES.
+    """
+    parts = selector.split(".")
+    if len(parts) == 1:
+        category = parts[0]
+        file = DEFAULT_FILES.get(category, category)
+        keys = []
+    elif len(parts) == 2:
+        category, file = parts
+        keys = []
+    else:
+        category, file, *keys = parts
+    return category, file, keys
+
+class SelectorRegistry:
+    """
+    Keeps every selector file under `root` compiled in memory.
+    Each lookup stats the file and recompiles it only if the mtime moved, so edits still apply without a restart.
+    """
+
+    def __init__(self, root: Path = SELECTOR_ROOT):
+        self.root = root
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._preloaded = False
+
+    def preload(self, strict: bool = True):
+        """
+        Compiles every selector file up front.
+        With strict=False a broken file is skipped here and only raises when someone actually asks for it.
+        """
+        self._preloaded = True
+        for folder in self.root.iterdir():
+            if folder.is_dir():
+                for jsonfile in folder.glob("*.json"):
+                    try:
+                        self.get(folder.name, jsonfile.stem)
+                    except ValueError:
+                        if strict:
+                            raise
+
+    def get(self, category: str, filename: str) -> SelectorPlan:
+        """
+        Returns the compiled plan for category/filename, recompiling if the file changed on disk.
+        """
+        if not self._preloaded:
+            self.preload(strict=False)
+        file_path = self.root / category / f"{filename}.json"
+        try:
+            mtime = file_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._plans.pop((category, filename), None)
+            raise FileNotFoundError(f"Selector file not found: {file_path}")
+
+        plan = self._plans.get((category, filename))
+        if plan is not None and plan.mtime == mtime:
+            return plan
+
+        with self._lock:
+            plan = self._plans.get((category, filename))
+            if plan is None or plan.mtime != mtime:
+                try:
+                    plan = SelectorPlan(category, filename, file_path, mtime, _read_json(file_path))
+                except soupsieve.SelectorSyntaxError as e:
+                    raise ValueError(f"Selector file {file_path} has an invalid CSS selector: {e}")
+                self._plans[(category, filename)] = plan
+        return plan
+
+    def resolve(self, selector_string: str):
+        """
+        Turns a selector string into (plan, keys), with DEFAULT_FILES aliases already applied.
+        """
+        category, filename, keys = parse_selector_string(selector_string)
+        return self.get(category, filename), keys
+
+    def plans(self) -> list:
+        """
+        Every currently compiled plan, handy for listing keys without touching disk again.
+        """
+        if not self._preloaded:
+            self.preload(strict=False)
+        return list(self._plans.values())
+
+def _read_json(file_path: Path) -> dict:
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             return json.load(f)
     except json.JSONDecodeError as e:
         raise ValueError(f"Selector file {file_path} is not valid JSON: {e}")
 
+# One registry for the whole bot process
+registry = SelectorRegistry()
+
+########################
+### File-level tools ###
+########################
+
+def load_selectors(category: str, filename: str) -> dict:
+    """
+    Loads the selector dict for a given category/folder and filename.
+    Served from the registry, so this is a copy you're free to mess with.
+    """
+    return copy.deepcopy(registry.get(category, filename).raw)
+
 def list_categories() -> list:
     """
     Lists all categories (subfolders) in selectors/.
@@ -44,5 +358,4 @@ def list_keys(category: str, filename: str) -> list:
     """
     Lists all top-level keys in the specified selector file.
     """
-    sel = load_selectors(category, filename)
-    return list(sel.keys())
+    return list(registry.get(category, filename).root.children.keys())
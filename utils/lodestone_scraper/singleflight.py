@@ -0,0 +1,96 @@
+"""
+Request coalescing for the scraper.
+When a crowd asks for the same page at the same moment, only the first caller actually downloads and parses it,
+everyone else awaits that one result. Each caller still runs its own extraction on the shared parsed page.
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("bot")
+
+
+class SingleFlight:
+    """
+    In-process coalescing: one running task per key, every concurrent caller for that key awaits it.
+    The work runs in its own task, so a caller getting cancelled doesn't take everyone else down with it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._waiters = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key, fn):
+        """
+        Runs fn() for this key unless it's already running, in which case we just wait for that run.
+        If every caller waiting on a run gets cancelled, the run is cancelled too.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._landed(key, t))
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters[task] == 1:
+                task.cancel()  # nobody left who wants it
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    def _landed(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        self._waiters.pop(task, None)
+        # Mark the exception as seen, if every caller was cancelled nobody else will
+        if not task.cancelled():
+            task.exception()
+
+
+# One per process, shared by every scraper
+page_flights = SingleFlight()
+
+
+async def redis_coalesce(url: str, fetch, cached, lock_timeout: float = 30, poll: float = 0.1):
+    """
+    Cross-process coalescing through a Redis lock, for when several bot processes share the page cache.
+    Whoever gets the lock for this URL runs fetch() (which fills the page cache), everyone else waits for the lock
+    to go away and then reads the page back with cached(). If the cache still comes up empty we fetch it ourselves.
+    Redis trouble just means no coalescing, never a failed scrape.
+    """
+    try:
+        from utils.database import redis
+        lock = redis.lodestone_fetch_lock(url, lock_timeout)
+        acquired = await lock.acquire(blocking=False)
+    except Exception:
+        logger.warning("Lodestone fetch lock unavailable for %s", url, exc_info=True)
+        return await fetch()
+
+    if acquired:
+        try:
+            return await fetch()
+        finally:
+            try:
+                await lock.release()
+            except Exception:
+                pass  # expired under us, the timeout cleans it up either way
+
+    # Someone else is downloading it, wait for them to finish and read their copy
+    deadline = time.monotonic() + lock_timeout
+    try:
+        while time.monotonic() < deadline and await redis.lodestone_fetch_locked(url):
+            await asyncio.sleep(poll)
+    except Exception:
+        logger.warning("Lost track of the Lodestone fetch lock for %s", url, exc_info=True)
+    body = await cached()
+    if body is not None:
+        return body
+    return await fetch()
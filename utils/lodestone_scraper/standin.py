@@ -0,0 +1,222 @@
+"""
+A local stand-in for the Lodestone, so the scraper can be load tested without hammering Square Enix.
+Serves the pages from fixtures/ (see bench.py) at the same URL shapes as uris.py, any ID, and can be told to misbehave:
+added latency and jitter, 429s and 503s, bodies dripped out slowly and maintenance (a 503 with an hour's Retry-After).
+Pages with a pager (FC members, achievements, searches) are served as every page of a list: ?page=N gets "Page N of M"
+and its own entry IDs, so paginated walks see new entries on every page. M is the fixture's own page count or --pages.
+
+    python -m utils.lodestone_scraper.standin --port 8080 --latency 80 --jitter 40 --rate-429 0.02 --drip 0.05
+
+then point a scraper at it with LodestoneScraper(base_url="http://127.0.0.1:8080") (or scraper.set_default_base_url),
+and see loadtest.py for a driver. GET /_standin/stats has the per-page/per-status counts.
+"""
+
+import argparse
+import asyncio
+import random
+import re
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+from .bench import FIXTURES_DIR, page_name
+from .uris import applicable_uris
+
+# Page N's entry IDs are page 1's plus (N - 1) * this. Real achievement IDs are in the low thousands, so it's
+# clear of them, and stays under xiv_char_achievements' INTEGER column for anything up to ~2000 pages
+PAGE_ID_STRIDE = 10 ** 6
+
+_PAGER = re.compile(rb"Page\s+(\d+)\s+of\s+(\d+)")
+# Links to a list entry, a character (FC members, search results) or one of their achievements
+_ENTRY_ID = re.compile(rb'(href="/lodestone/character/(?:\d+/achievement/detail/)?)(\d+)(/")')
+
+# Good enough for the verification fields when --fixtures points at a folder without a character page
+FALLBACK_CHARACTER = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Stand-in Character | FINAL FANTASY XIV, The Lodestone</title></head>
+<body><div id="character"><div class="frame__chara">
+<div class="frame__chara__box"><p class="frame__chara__title">Stand-in</p></div>
+<div class="frame__chara__box"><p class="frame__chara__name">Standin Character</p></div>
+<p class="frame__chara__world">Cerberus [Chaos]</p>
+</div>
+<div class="character__selfintroduction">Stand-in Lodestone page, no verification token here.</div>
+</div></body></html>
+"""
+
+MAINTENANCE_RETRY_AFTER = 3600  # seconds, what a maintenance 503 says, long enough that the breaker reads it as downtime
+
+
+class StandinConfig:
+    """
+    How badly the stand-in behaves. Rates are chances per request (0.0 - 1.0), times are in milliseconds.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        rate_429: float = 0.0,
+        rate_503: float = 0.0,
+        maintenance: float = 0.0,
+        retry_after: int | None = 1,
+        drip: float = 0.0,
+        drip_chunk: int = 4096,
+        drip_delay: float = 50,
+        pages: int | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_503 = rate_503
+        self.maintenance = maintenance
+        self.retry_after = retry_after  # seconds, sent on 429s, None sends no header
+        self.drip = drip
+        self.drip_chunk = drip_chunk
+        self.drip_delay = drip_delay
+        self.pages = pages  # how many pages a paginated list has, None keeps what the fixture's pager says
+
+
+def make_app(config: StandinConfig | None = None, fixtures_dir: Path = FIXTURES_DIR, seed: int | None = None) -> web.Application:
+    """
+    Builds the stand-in aiohttp app, run it with web.run_app() or an AppRunner.
+    """
+    app = web.Application()
+    app["config"] = config or StandinConfig()
+    app["routes"] = _routes()
+    app["pages"] = _load_pages(fixtures_dir)
+    app["paged"] = {}  # (page name, page number) -> body, rewritten once
+    app["stats"] = Counter()
+    app["random"] = random.Random(seed)
+    app.router.add_get("/_standin/stats", _stats)
+    app.router.add_get("/{tail:.*}", _serve)
+    return app
+
+def _routes() -> list:
+    # (compiled path regex, page name), one per URL shape in uris.py
+    routes = {}
+    for uri_key, template in applicable_uris.items():
+        path = "/lodestone/" + template.split("/lodestone/", 1)[1]
+        pattern = "^" + re.escape(path).replace(re.escape("%s"), "[^/]+") + "$"
+        routes[pattern] = page_name(uri_key)
+    return [(re.compile(pattern), name) for pattern, name in routes.items()]
+
+def _load_pages(fixtures_dir: Path) -> dict:
+    pages = {path.stem: path.read_bytes() for path in Path(fixtures_dir).glob("*.html")}
+    pages.setdefault("character", FALLBACK_CHARACTER.encode("utf-8"))
+    return pages
+
+def _page_of(app, name: str, body: bytes, query) -> bytes | None:
+    """
+    The body for ?page=N of a paginated page, None if the list isn't that long. Pages without a pager come back as is.
+    """
+    pager = _PAGER.search(body)
+    if pager is None:
+        return body
+    try:
+        number = int(query.get("page", 1))
+    except ValueError:
+        number = 1
+    total = app["config"].pages or int(pager.group(2))
+    if not 1 <= number <= total:
+        return None
+    key = (name, number)
+    if key not in app["paged"]:
+        app["paged"][key] = _paginate(body, number, total)
+    return app["paged"][key]
+
+def _paginate(body: bytes, number: int, total: int) -> bytes:
+    body = _PAGER.sub(f"Page {number} of {total}".encode(), body)
+    offset = (number - 1) * PAGE_ID_STRIDE
+    if offset:
+        body = _ENTRY_ID.sub(lambda m: m.group(1) + str(int(m.group(2)) + offset).encode() + m.group(3), body)
+    return body
+
+async def _stats(request):
+    return web.json_response(dict(request.app["stats"]))
+
+async def _serve(request):
+    app = request.app
+    config = app["config"]
+    rng = app["random"]
+    stats = app["stats"]
+
+    name = next((name for pattern, name in app["routes"] if pattern.match(request.path)), None)
+    body = app["pages"].get(name)
+    if body is not None:
+        body = _page_of(app, name, body, request.query)
+    if body is None:
+        stats["404"] += 1
+        return web.Response(status=404, text="Not Found")
+
+    delay = max(config.latency + rng.uniform(-config.jitter, config.jitter), 0)
+    if delay:
+        await asyncio.sleep(delay / 1000)
+
+    # Pick at most one misbehaviour per request
+    roll = rng.random()
+    if roll < config.maintenance:
+        stats["maintenance"] += 1
+        return web.Response(status=503, text="Service Unavailable", headers={"Retry-After": str(MAINTENANCE_RETRY_AFTER)})
+    roll -= config.maintenance
+    if roll < config.rate_429:
+        stats["429"] += 1
+        headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+        return web.Response(status=429, text="Too Many Requests", headers=headers)
+    roll -= config.rate_429
+    if roll < config.rate_503:
+        stats["503"] += 1
+        return web.Response(status=503, text="Service Unavailable")
+
+    stats[f"200 {name}"] += 1
+    if rng.random() < config.drip:
+        stats["drip"] += 1
+        return await _drip(request, body, config)
+    return web.Response(body=body, content_type="text/html", charset="utf-8")
+
+async def _drip(request, body: bytes, config: StandinConfig):
+    # Trickle the page out a chunk at a time, like a congested Lodestone does
+    resp = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+    await resp.prepare(request)
+    try:
+        for start in range(0, len(body), config.drip_chunk):
+            await resp.write(body[start:start + config.drip_chunk])
+            await asyncio.sleep(config.drip_delay / 1000)
+        await resp.write_eof()
+    except ConnectionResetError:
+        pass  # client had what it wanted (streaming reads hang up early)
+    return resp
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.lodestone_scraper.standin", description="Local stand-in Lodestone server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0, help="ms added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="+/- ms of random latency on top")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="chance of a 429")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="chance of a plain 503")
+    parser.add_argument("--maintenance", type=float, default=0.0, help="chance of a 503 with a maintenance-length Retry-After")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s, negative for none")
+    parser.add_argument("--drip", type=float, default=0.0, help="chance of a slow-drip body")
+    parser.add_argument("--drip-chunk", type=int, default=4096, help="bytes per drip")
+    parser.add_argument("--drip-delay", type=float, default=50, help="ms between drips")
+    parser.add_argument("--pages", type=int, help="serve every paginated list as this many pages (default: the fixture's own)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    config = StandinConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        rate_503=args.rate_503,
+        maintenance=args.maintenance,
+        retry_after=args.retry_after if args.retry_after >= 0 else None,
+        drip=args.drip,
+        drip_chunk=args.drip_chunk,
+        drip_delay=args.drip_delay,
+        pages=args.pages,
+    )
+    web.run_app(make_app(config, args.fixtures, args.seed), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
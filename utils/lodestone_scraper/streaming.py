@@ -0,0 +1,129 @@
+"""
+Streaming reads for the scraper.
+Instead of buffering a whole character page before parsing any of it, the body is fed chunk by chunk into lxml's
+incremental parser as it comes off the wire. Once every field the caller asked for has been seen in full we stop reading,
+so a verification lookup of BIO doesn't wait for (or hold in memory) the hundreds of KB of gear tooltips below it.
+Every read is capped at a max body size either way.
+"""
+
+import codecs
+
+from lxml import etree
+
+from .selectors import FieldSelector, FieldOpsSelector, GroupSelector, ChildStep, split_child_chain
+from .errors import LodestoneBodyTooLarge
+
+MAX_BODY = 4 * 1024 * 1024  # bytes, the biggest character pages are well under 1MB
+CHUNK_SIZE = 16 * 1024
+
+
+class StopWatcher:
+    """
+    Parses a page as it streams in and says when every watched field has a fully closed match.
+    Fields are `>` chains of simple steps, checked by walking up from each element as lxml closes it.
+    """
+
+    def __init__(self, chains: list):
+        self._chains = chains
+        self.reset()
+
+    def reset(self):
+        # Start over, for when a download is retried from scratch
+        self._pending = list(self._chains)
+        self._parser = etree.HTMLPullParser(events=("end",))
+
+    def feed(self, text: str) -> bool:
+        """
+        Feeds the next piece of the page, returns True once everything watched has turned up.
+        """
+        self._parser.feed(text)
+        for _, element in self._parser.read_events():
+            if self._pending:
+                self._pending = [chain for chain in self._pending if not _matches_chain(element, chain)]
+        return not self._pending
+
+
+def watcher_for(targets):
+    """
+    A StopWatcher for these compiled selectors, or None if any of them needs the whole page
+    (multiple matches, lists, field ops, or selectors that aren't simple `>` chains).
+    """
+    chains = []
+    for target in targets:
+        for field in _watchable_fields(target):
+            if field is None:
+                return None
+            steps = split_child_chain(field.selector, simple_first=True)
+            if steps is None:
+                return None
+            chains.append([ChildStep(step) for step in steps])
+    if not chains:
+        return None
+    return StopWatcher(chains)
+
+async def read_body(resp, url: str, watcher: StopWatcher | None = None, max_body: int = MAX_BODY):
+    """
+    Reads and decodes a response body, raising LodestoneBodyTooLarge past max_body bytes.
+    With a watcher it stops as soon as the watcher is satisfied. Returns (html, complete).
+    """
+    length = resp.content_length
+    if length is not None and length > max_body:
+        raise LodestoneBodyTooLarge(length, max_body, url)
+
+    if watcher is not None:
+        watcher.reset()
+    decoder = codecs.getincrementaldecoder(resp.charset or "utf-8")(errors="replace")
+    parts = []
+    size = 0
+    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_body:
+            raise LodestoneBodyTooLarge(size, max_body, url)
+        text = decoder.decode(chunk)
+        parts.append(text)
+        if watcher is not None and text and watcher.feed(text):
+            # Got everything we came for, don't bother with the rest of the page
+            resp.close()
+            return "".join(parts), False
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), True
+
+def _watchable_fields(target):
+    # Yields the FieldSelectors a target boils down to, or None for anything a watcher can't judge
+    if isinstance(target, FieldSelector):
+        yield None if target.multiple else target
+    elif isinstance(target, FieldOpsSelector) or not isinstance(target, GroupSelector) or target.entry_root is not None:
+        yield None
+    else:
+        for sub in target.children.values():
+            yield from _watchable_fields(sub)
+
+def _matches_chain(element, chain) -> bool:
+    # The element has to match the last step, its parent the one before that, and so on up the chain
+    node = element
+    for step in reversed(chain):
+        if node is None or not _matches_step(node, step):
+            return False
+        node = node.getparent()
+    return True
+
+def _matches_step(element, step) -> bool:
+    if not isinstance(element.tag, str):
+        return False  # comments and processing instructions
+    if step.tag is not None and element.tag != step.tag:
+        return False
+    if step.id is not None and element.get("id") != step.id:
+        return False
+    if step.classes:
+        classes = (element.get("class") or "").split()
+        if not all(cls in classes for cls in step.classes):
+            return False
+    if step.nth is not None:
+        position = 1 + sum(1 for sibling in element.itersiblings(preceding=True) if isinstance(sibling.tag, str))
+        if position != step.nth:
+            return False
+    if step.nth_of_type is not None:
+        position = 1 + sum(1 for sibling in element.itersiblings(preceding=True) if sibling.tag == element.tag)
+        if position != step.nth_of_type:
+            return False
+    return True